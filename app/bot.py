@@ -1,15 +1,19 @@
 import os
 import asyncio
 import logging
-from pathlib import Path
-from pyrogram import Client, filters
+from pyrogram import Client, filters, idle
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from datetime import datetime
 
 from .config import Config
 from .youtube_uploader import YouTubeUploader
 from .video_downloader import VideoDownloader
 from .auth_handler import AuthHandler
+from .scheduler import JobScheduler
+from .job_store import open_job_store
+from .pipeline import JobPipeline
+from .media_pool import MediaClientPool
+from .outbox import Outbox
+from .upload_ledger import file_key, url_key
 
 # Configure logging
 logging.basicConfig(
@@ -25,15 +29,27 @@ class TelegramYouTubeBot:
             api_id=Config.API_ID,
             api_hash=Config.API_HASH,
             bot_token=Config.BOT_TOKEN,
-            workdir=str(Config.SESSION_DIR)
+            workdir=str(Config.SESSION_DIR),
+            # Without media clients all connections of a download go through this one
+            max_concurrent_transmissions=max(Config.TELEGRAM_DOWNLOAD_CONNECTIONS,
+                                             Config.TELEGRAM_TRANSMISSIONS_PER_CLIENT)
         )
 
         self.youtube_uploader = YouTubeUploader()
         self.video_downloader = VideoDownloader()
         self.auth_handler = AuthHandler()
 
-        # Track processing states
-        self.processing_users = set()
+        # Durable job state and per-user job queues with global stage limits
+        self.job_store = open_job_store()
+        self.scheduler = JobScheduler(self.run_job)
+        # Media transfers run on their own sessions so updates are never starved
+        self.media_pool = MediaClientPool("youtube_bot", Config.MEDIA_CLIENTS, self.app)
+        # Every reply and edit is paced and retried after FloodWait by one outbound queue
+        self.outbox = Outbox(self.app)
+        self.pipeline = JobPipeline(
+            self.app, self.job_store, self.youtube_uploader, self.video_downloader, self.scheduler,
+            self.media_pool, self.outbox
+        )
 
         # Register handlers
         self.register_handlers()
@@ -47,7 +63,8 @@ class TelegramYouTubeBot:
                 [InlineKeyboardButton("ℹ️ Help", callback_data="help")]
             ])
 
-            await message.reply_text(
+            await self.outbox.reply(
+                message,
                 "🎥 **YouTube Uploader Bot**\n\n"
                 "Welcome! I can help you upload videos to YouTube.\n\n"
                 "**Features:**\n"
@@ -84,28 +101,26 @@ class TelegramYouTubeBot:
         @self.app.on_message(filters.video | filters.document)
         async def handle_media(client, message: Message):
             if message.document and not (message.document.mime_type and message.document.mime_type.startswith('video/')):
-                await message.reply_text("📎 **Document received**\n\nPlease send video files only.")
+                await self.outbox.reply(message, "📎 **Document received**\n\nPlease send video files only.")
                 return
 
-            await self.process_video_file(message)
+            await self.enqueue_job(message, 'file')
 
         @self.app.on_message(filters.text & ~filters.command(["start", "auth", "oauth"]))
         async def handle_text_message(client, message: Message):
             text = message.text.strip()
-            user_id = message.from_user.id
-
-            # Prevent multiple simultaneous processing
-            if user_id in self.processing_users:
-                await message.reply_text("⏳ **Processing in progress**\n\nPlease wait for the current operation to complete.")
-                return
 
             # Check if it's an OAuth code (FIXED LOGIC)
             if self.is_oauth_code(text):
                 await self.handle_oauth_code(message, text)
             elif self.is_video_url(text):
-                await self.process_video_url(message, text)
+                # Queue every link in the message
+                for url in text.split():
+                    if self.is_video_url(url):
+                        await self.enqueue_job(message, 'url', url)
             else:
-                await message.reply_text(
+                await self.outbox.reply(
+                    message,
                     "❓ **Unrecognized Input**\n\n"
                     "Please send:\n"
                     "• A video file (MP4, AVI, MOV, etc.)\n"
@@ -125,7 +140,8 @@ class TelegramYouTubeBot:
                 code = ' '.join(message.command[1:])  # Join all parts after /oauth
                 await self.handle_oauth_code(message, code)
             else:
-                await message.reply_text(
+                await self.outbox.reply(
+                    message,
                     "**OAuth Code Command**\n\n"
                     "Usage: `/oauth your_authorization_code`\n\n"
                     "Example: `/oauth 4/1AVMBsJjws3uaafmYm7iEBcni4Cmq2aBK81QQyOhW34CU_C5n7JqvUTIBhRM`"
@@ -173,7 +189,8 @@ class TelegramYouTubeBot:
                     [InlineKeyboardButton("🔙 Back to Main", callback_data="back_to_main")]
                 ])
 
-                await callback_query.message.edit_text(
+                await self.outbox.edit(
+                    callback_query.message,
                     f"✅ **YouTube Authentication Active**\n\n"
                     f"📺 **Channel:** {channel_name}\n"
                     f"🔐 **Method:** {auth_method}\n"
@@ -190,7 +207,8 @@ class TelegramYouTubeBot:
                     [InlineKeyboardButton("🔙 Back to Main", callback_data="back_to_main")]
                 ])
 
-                await callback_query.message.edit_text(
+                await self.outbox.edit(
+                    callback_query.message,
                     "❌ **YouTube Authentication Required**\n\n"
                     "Authentication methods available:\n"
                     "• **Service Account** (automatic if configured)\n"
@@ -212,7 +230,8 @@ class TelegramYouTubeBot:
                     [InlineKeyboardButton("🔙 Back to Main", callback_data="back_to_main")]
                 ])
 
-                await callback_query.message.edit_text(
+                await self.outbox.edit(
+                    callback_query.message,
                     "🔐 **OAuth Setup Process**\n\n"
                     "**Steps:**\n"
                     "1. Click the link below to authorize\n"
@@ -228,7 +247,8 @@ class TelegramYouTubeBot:
                     reply_markup=keyboard
                 )
             else:
-                await callback_query.message.edit_text(
+                await self.outbox.edit(
+                    callback_query.message,
                     "❌ **OAuth Setup Failed**\n\n"
                     "Could not generate authorization URL.\n"
                     "Possible issues:\n"
@@ -246,7 +266,8 @@ class TelegramYouTubeBot:
             [InlineKeyboardButton("🔙 Back to Main", callback_data="back_to_main")]
         ])
 
-        await callback_query.message.edit_text(
+        await self.outbox.edit(
+            callback_query.message,
             "📋 **How to Use YouTube Upload Bot**\n\n"
             "**1. Authentication:**\n"
             "• Service Account: Automatic (if configured)\n"
@@ -278,7 +299,8 @@ class TelegramYouTubeBot:
             [InlineKeyboardButton("ℹ️ Help", callback_data="help")]
         ])
 
-        await callback_query.message.edit_text(
+        await self.outbox.edit(
+            callback_query.message,
             "🎥 **YouTube Uploader Bot**\n\n"
             "Welcome! I can help you upload videos to YouTube.\n\n"
             "**Features:**\n"
@@ -292,11 +314,8 @@ class TelegramYouTubeBot:
 
     async def handle_oauth_code(self, message: Message, code: str):
         """Handle OAuth authorization code"""
-        user_id = message.from_user.id
-
         try:
-            self.processing_users.add(user_id)
-            status_msg = await message.reply_text("🔐 **Processing authorization code...**")
+            status_msg = await self.outbox.reply(message, "🔐 **Processing authorization code...**")
 
             logger.info(f"Processing OAuth code: {code[:10]}...")
 
@@ -310,7 +329,8 @@ class TelegramYouTubeBot:
                 if channel_info:
                     channel_name = channel_info.get('snippet', {}).get('title', 'Unknown')
 
-                await status_msg.edit_text(
+                await self.outbox.edit(
+                    status_msg,
                     f"✅ **Authentication Successful!**\n\n"
                     f"📺 **Channel:** {channel_name}\n"
                     f"🔐 **Method:** OAuth 2.0\n"
@@ -319,7 +339,8 @@ class TelegramYouTubeBot:
                     "Send me a video file or URL to get started."
                 )
             else:
-                await status_msg.edit_text(
+                await self.outbox.edit(
+                    status_msg,
                     "❌ **Authentication Failed**\n\n"
                     "The authorization code may be:\n"
                     "• Invalid or expired\n"
@@ -331,9 +352,7 @@ class TelegramYouTubeBot:
 
         except Exception as e:
             logger.error(f"OAuth code handling failed: {e}")
-            await message.reply_text(f"❌ **Error:** {str(e)}")
-        finally:
-            self.processing_users.discard(user_id)
+            await self.outbox.reply(message, f"❌ **Error:** {str(e)}")
 
     def is_video_url(self, text: str) -> bool:
         """Check if the text is a valid video URL"""
@@ -346,236 +365,73 @@ class TelegramYouTubeBot:
         text_lower = text.lower()
         return any(pattern in text_lower for pattern in video_patterns)
 
-    async def process_video_file(self, message: Message):
-        """Process uploaded video file"""
+    async def enqueue_job(self, message: Message, kind: str, url: str = None):
+        """Add a video file or URL job to the user's queue and report its position"""
         user_id = message.from_user.id
 
-        if user_id in self.processing_users:
-            await message.reply_text("⏳ **Processing in progress**\n\nPlease wait for the current operation to complete.")
+        # In frontend mode the jobs are run by separate worker processes
+        if Config.RUN_MODE == 'frontend':
+            ahead = self.job_store.pending(user_id)
+        else:
+            ahead = self.scheduler.pending(user_id)
+
+        if ahead >= Config.MAX_QUEUED_JOBS_PER_USER:
+            await self.outbox.reply(
+                message,
+                "⏳ **Queue Full**\n\n"
+                f"You already have {Config.MAX_QUEUED_JOBS_PER_USER} videos waiting.\n"
+                "Please wait for some of them to finish."
+            )
             return
 
-        try:
-            self.processing_users.add(user_id)
-
-            # Check authentication first
-            auth_status = await self.youtube_uploader.check_authentication()
-            if not auth_status:
-                await message.reply_text(
-                    "❌ **Authentication Required**\n\n"
-                    "Please authenticate with YouTube first.\n\n"
-                    "**Options:**\n"
-                    "• Service Account (automatic if configured)\n"
-                    "• OAuth 2.0: Use /start → Setup OAuth"
-                )
-                return
-
-            video = message.video or message.document
-            file_size = video.file_size
-            file_name = getattr(video, 'file_name', None) or f"video_{video.file_unique_id}"
-
-            # Check file size
-            if file_size > Config.MAX_FILE_SIZE:
-                await message.reply_text(
-                    f"❌ **File Too Large**\n\n"
-                    f"📁 **Size:** {file_size / (1024*1024):.1f} MB\n"
-                    f"📏 **Limit:** {Config.MAX_FILE_SIZE / (1024*1024):.1f} MB\n\n"
-                    "Please send a smaller file."
-                )
-                return
-
-            # Check duration for video files
-            if hasattr(video, 'duration') and video.duration:
-                if video.duration > Config.MAX_VIDEO_DURATION:
-                    await message.reply_text(
-                        f"❌ **Video Too Long**\n\n"
-                        f"⏱️ **Duration:** {video.duration // 60} minutes\n"
-                        f"⏰ **Limit:** {Config.MAX_VIDEO_DURATION // 60} minutes\n\n"
-                        "Please send a shorter video."
-                    )
-                    return
-
-            status_msg = await message.reply_text("⏬ **Downloading video...**")
-
-            # Create unique file path
-            file_extension = Path(file_name).suffix or '.mp4'
-            file_path = Config.TEMP_DIR / f"{video.file_unique_id}{file_extension}"
-
-            # Download video file
-            await message.download(file_path)
-
-            await status_msg.edit_text("🔍 **Preparing for upload...**")
-
-            # Prepare video metadata
-            video_title = Path(file_name).stem
-            if len(video_title) > 100:
-                video_title = video_title[:100]
-
-            video_info = {
-                'title': video_title,
-                'description': f"Uploaded via Telegram Bot on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\nOriginal filename: {file_name}\nFile size: {file_size / (1024*1024):.1f} MB\nUploaded by: @{message.from_user.username or message.from_user.first_name}",
-                'tags': ['telegram', 'bot', 'upload', 'video'],
-                'category_id': '22',
-                'privacy_status': Config.YOUTUBE_PRIVACY_STATUS
-            }
-
-            await status_msg.edit_text("⏫ **Uploading to YouTube...**\n\n*This may take a while for large files...*")
-
-            # Upload to YouTube
-            youtube_url = await self.youtube_uploader.upload_video(str(file_path), video_info)
-
-            if youtube_url:
-                auth_method = await self.youtube_uploader.get_auth_method()
-                await status_msg.edit_text(
-                    f"✅ **Upload Successful!**\n\n"
-                    f"🎥 **YouTube URL:** {youtube_url}\n"
-                    f"📁 **File:** {file_name}\n"
-                    f"💾 **Size:** {file_size / (1024*1024):.1f} MB\n"
-                    f"🔐 **Auth:** {auth_method}\n"
-                    f"🔒 **Privacy:** {Config.YOUTUBE_PRIVACY_STATUS}\n"
-                    f"📅 **Uploaded:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-                    "🎉 Your video is now live on YouTube!"
-                )
-            else:
-                await status_msg.edit_text(
-                    "❌ **Upload Failed**\n\n"
-                    "The video could not be uploaded to YouTube.\n"
-                    "Possible reasons:\n"
-                    "• Authentication expired\n"
-                    "• File format not supported by YouTube\n"
-                    "• Network connectivity issues\n"
-                    "• YouTube API quota exceeded\n\n"
-                    "Please try again later."
-                )
-
-        except Exception as e:
-            logger.error(f"Error processing video file: {e}")
-            await message.reply_text(f"❌ **Error:** {str(e)}")
-        finally:
-            self.processing_users.discard(user_id)
-            # Cleanup
-            if 'file_path' in locals() and file_path.exists():
-                try:
-                    file_path.unlink()
-                except:
-                    pass
-
-    async def process_video_url(self, message: Message, url: str):
-        """Process video URL"""
-        user_id = message.from_user.id
-
-        if user_id in self.processing_users:
-            await message.reply_text("⏳ **Processing in progress**\n\nPlease wait for the current operation to complete.")
+        # Videos we uploaded before are answered from the ledger without queueing
+        if kind == 'file':
+            content_keys = [file_key((message.video or message.document).file_unique_id)]
+        else:
+            content_keys = [url_key(url)]
+        youtube_url = self.pipeline.upload_ledger.lookup(*content_keys)
+        if youtube_url:
+            await self.outbox.reply(message, self.pipeline.duplicate_text(youtube_url))
             return
 
-        try:
-            self.processing_users.add(user_id)
-
-            # Check authentication first
-            auth_status = await self.youtube_uploader.check_authentication()
-            if not auth_status:
-                await message.reply_text(
-                    "❌ **Authentication Required**\n\n"
-                    "Please authenticate with YouTube first.\n\n"
-                    "**Options:**\n"
-                    "• Service Account (automatic if configured)\n"
-                    "• OAuth 2.0: Use /start → Setup OAuth"
-                )
-                return
-
-            status_msg = await message.reply_text("🔍 **Analyzing URL...**")
-
-            # Get video info first
-            info_result = await self.video_downloader.get_video_info(url)
-            if not info_result['success']:
-                await status_msg.edit_text(f"❌ **URL Analysis Failed**\n\n**Error:** {info_result['error']}")
-                return
-
-            video_info = info_result['info']
+        status_msg = None
+        if ahead or Config.RUN_MODE == 'frontend':
+            status_msg = await self.outbox.reply(
+                message,
+                f"🕒 **Queued** (position {ahead + 1})\n\n"
+                f"{ahead} of your videos {'is' if ahead == 1 else 'are'} ahead of this one.\n"
+                "I'll start on it automatically."
+            )
 
-            # Check duration
-            if video_info['duration'] > Config.MAX_VIDEO_DURATION:
-                await status_msg.edit_text(
-                    f"❌ **Video Too Long**\n\n"
-                    f"⏱️ **Duration:** {video_info['duration'] // 60} minutes\n"
-                    f"⏰ **Limit:** {Config.MAX_VIDEO_DURATION // 60} minutes\n\n"
-                    f"**Video:** {video_info['title']}"
-                )
-                return
+        job = self.job_store.create(
+            kind=kind,
+            user_id=user_id,
+            chat_id=message.chat.id,
+            message_id=message.id,
+            status_message_id=status_msg.id if status_msg else None,
+            username=message.from_user.username or message.from_user.first_name,
+            url=url,
+            content_keys=content_keys
+        )
 
-            await status_msg.edit_text(
-                f"📹 **Video Found**\n\n"
-                f"**Title:** {video_info['title'][:50]}...\n"
-                f"**Duration:** {video_info['duration'] // 60}:{video_info['duration'] % 60:02d}\n"
-                f"**Uploader:** {video_info['uploader']}\n"
-                f"**Views:** {video_info['view_count']:,}\n\n"
-                "⏬ **Starting download...**"
-            )
+        if Config.RUN_MODE != 'frontend':
+            # Keep the message around so the first run does not have to fetch it
+            job['message'] = message
+            self.scheduler.submit(job)
 
-            # Download video from URL
-            download_result = await self.video_downloader.download_video(url, Config.TEMP_DIR)
-
-            if not download_result['success']:
-                await status_msg.edit_text(
-                    f"❌ **Download Failed**\n\n"
-                    f"**Error:** {download_result['error']}\n"
-                    f"**URL:** {url}\n\n"
-                    "**Common causes:**\n"
-                    "• Video is private or removed\n"
-                    "• Geographic restrictions\n"
-                    "• Platform blocking downloads"
-                )
-                return
+    async def recover_jobs(self):
+        """Re-queue jobs left unfinished by a crash or restart"""
+        jobs = self.job_store.unfinished()
+        if not jobs:
+            return
 
-            file_path = download_result['file_path']
-            video_info = download_result['info']
-
-            await status_msg.edit_text("⏫ **Uploading to YouTube...**\n\n*This may take a while...*")
-
-            # Prepare video metadata
-            video_title = video_info.get('title', 'Downloaded Video')
-            if len(video_title) > 100:
-                video_title = video_title[:100]
-
-            upload_info = {
-                'title': video_title,
-                'description': f"Downloaded from: {url}\n\nOriginal uploader: {video_info.get('uploader', 'Unknown')}\nOriginal views: {video_info.get('view_count', 0):,}\nUploaded via Telegram Bot on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\nBot user: @{message.from_user.username or message.from_user.first_name}\n\n{video_info.get('description', '')[:4000]}",
-                'tags': (video_info.get('tags', []) + ['telegram', 'bot', 'download'])[:30],
-                'category_id': '22',
-                'privacy_status': Config.YOUTUBE_PRIVACY_STATUS
-            }
-
-            youtube_url = await self.youtube_uploader.upload_video(file_path, upload_info)
-
-            if youtube_url:
-                auth_method = await self.youtube_uploader.get_auth_method()
-                await status_msg.edit_text(
-                    f"✅ **Upload Successful!**\n\n"
-                    f"🎥 **YouTube URL:** {youtube_url}\n"
-                    f"🔗 **Source:** {url}\n"
-                    f"📝 **Title:** {upload_info['title']}\n"
-                    f"🔐 **Auth:** {auth_method}\n"
-                    f"🔒 **Privacy:** {Config.YOUTUBE_PRIVACY_STATUS}\n"
-                    f"📅 **Uploaded:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-                    "🎉 Your video is now live on YouTube!"
-                )
-            else:
-                await status_msg.edit_text(
-                    "❌ **Upload Failed**\n\n"
-                    "The video could not be uploaded to YouTube.\n"
-                    "Please check your authentication and try again."
-                )
+        logger.info(f"Recovering {len(jobs)} unfinished job(s)")
+        for job in jobs:
+            self.scheduler.submit(job)
 
-        except Exception as e:
-            logger.error(f"Error processing video URL: {e}")
-            await message.reply_text(f"❌ **Error:** {str(e)}")
-        finally:
-            self.processing_users.discard(user_id)
-            # Cleanup
-            if 'file_path' in locals() and Path(file_path).exists():
-                try:
-                    Path(file_path).unlink()
-                except:
-                    pass
+    async def run_job(self, job: dict):
+        """Run a queued job in this process"""
+        await self.pipeline.run_job(job)
 
     async def handle_auth_command(self, message: Message):
         """Handle /auth command"""
@@ -589,15 +445,19 @@ class TelegramYouTubeBot:
                 if channel_info:
                     channel_name = channel_info.get('snippet', {}).get('title', 'Unknown')
 
-                await message.reply_text(
+                pool = self.youtube_uploader.pool
+                await self.outbox.reply(
+                    message,
                     f"✅ **Authentication Status: Active**\n\n"
                     f"📺 **Channel:** {channel_name}\n"
                     f"🔐 **Method:** {auth_method}\n"
-                    f"🔒 **Privacy:** {Config.YOUTUBE_PRIVACY_STATUS}\n\n"
+                    f"🔒 **Privacy:** {Config.YOUTUBE_PRIVACY_STATUS}\n"
+                    f"📊 **Quota:** {pool.used():,}/{pool.daily_limit():,} units today\n\n"
                     "You can upload videos now!"
                 )
             else:
-                await message.reply_text(
+                await self.outbox.reply(
+                    message,
                     "❌ **Authentication Status: Required**\n\n"
                     "**Available methods:**\n"
                     "• Service Account (automatic if configured)\n"
@@ -605,12 +465,13 @@ class TelegramYouTubeBot:
                 )
         except Exception as e:
             logger.error(f"Auth command error: {e}")
-            await message.reply_text(f"❌ **Error:** {str(e)}")
+            await self.outbox.reply(message, f"❌ **Error:** {str(e)}")
 
     def run(self):
         """Start the bot"""
         logger.info("Starting Telegram YouTube Bot...")
         logger.info(f"Environment: {Config.ENVIRONMENT}")
+        logger.info(f"Run Mode: {Config.RUN_MODE} (queue backend: {Config.JOB_QUEUE_BACKEND})")
         logger.info(f"Privacy Mode: {Config.YOUTUBE_PRIVACY_STATUS}")
         logger.info(f"Max File Size: {Config.MAX_FILE_SIZE / (1024*1024):.0f} MB")
         logger.info(f"Max Duration: {Config.MAX_VIDEO_DURATION / 60:.0f} minutes")
@@ -621,4 +482,20 @@ class TelegramYouTubeBot:
         Config.TEMP_DIR.mkdir(parents=True, exist_ok=True)
 
         # Start the bot
-        self.app.run()
+        self.app.run(self._main())
+
+    async def _main(self):
+        """Start the client, recover unfinished jobs and idle until stopped"""
+        await self.app.start()
+        tasks = [asyncio.create_task(self.youtube_uploader.run_token_refresher())]
+        if Config.RUN_MODE != 'frontend':
+            await self.media_pool.start()
+            tasks.append(asyncio.create_task(self.pipeline.run_janitor()))
+            await self.recover_jobs()
+        await idle()
+        for task in tasks:
+            task.cancel()
+        await self.media_pool.stop()
+        await self.youtube_uploader.close()
+        self.video_downloader.close()
+        await self.app.stop()
@@ -14,6 +14,14 @@ class Config:
     
     # YouTube API Configuration
     YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY', '')
+    YOUTUBE_HTTP_TRANSPORT = os.getenv('YOUTUBE_HTTP_TRANSPORT', 'aiohttp')  # aiohttp | httplib2
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 20))  # pooled connections to Google
+    HTTP_KEEPALIVE_TIMEOUT = int(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 60))
+    AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', 300))  # seconds a successful auth check is trusted
+    TOKEN_REFRESH_MARGIN = int(os.getenv('TOKEN_REFRESH_MARGIN', 300))  # refresh tokens this long before expiry
+    YOUTUBE_DAILY_QUOTA = int(os.getenv('YOUTUBE_DAILY_QUOTA', 10000))  # units per project per Pacific day
+    CREDENTIAL_COOLDOWN = int(os.getenv('CREDENTIAL_COOLDOWN', 600))  # seconds a failing credential is skipped
+    QUOTA_RESERVATION_LEASE = int(os.getenv('QUOTA_RESERVATION_LEASE', 600))  # reservations of a crashed process stop counting after this
     
     # Google Credentials - Individual components (legacy support)
     GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID', '')
@@ -28,16 +36,73 @@ class Config:
     CREDENTIALS_DIR = BASE_DIR / 'credentials'
     SESSION_DIR = BASE_DIR / 'session'
     TEMP_DIR = BASE_DIR / 'temp'
+    JOBS_DIR = TEMP_DIR / 'jobs'  # one workspace directory per job
+    
+    # Durable state lives on the temp volume, the one disk that persists on Render
+    STATE_DIR = TEMP_DIR / 'state'
+    UPLOAD_SESSION_DIR = STATE_DIR / 'uploads'
+    JOB_DB_FILE = STATE_DIR / 'jobs.db'
+    QUOTA_DIR = STATE_DIR / 'quota'
+    UPLOAD_LEDGER_FILE = STATE_DIR / 'ledger.db'
+    DISK_RESERVATION_FILE = STATE_DIR / 'disk.db'  # temp space reserved by running downloads, shared by all processes
     
     # Credential files (created from env vars)
     CLIENT_SECRET_FILE = CREDENTIALS_DIR / 'client_secret.json'
     SERVICE_ACCOUNT_FILE = CREDENTIALS_DIR / 'service_account.json'
     TOKEN_FILE = CREDENTIALS_DIR / 'token.json'
+    # Extra OAuth tokens and service account keys, one JSON file each
+    CREDENTIAL_POOL_DIR = CREDENTIALS_DIR / 'pool'
     
     # Upload Settings
     YOUTUBE_PRIVACY_STATUS = os.getenv('YOUTUBE_PRIVACY_STATUS', 'unlisted')
     MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 2 * 1024 * 1024 * 1024))  # 2GB
     MAX_VIDEO_DURATION = int(os.getenv('MAX_VIDEO_DURATION', 7200))  # 2 hours
+    FORMAT_MIN_HEIGHT = int(os.getenv('FORMAT_MIN_HEIGHT', 720))  # quality floor for URL downloads
+    FORMAT_MAX_HEIGHT = int(os.getenv('FORMAT_MAX_HEIGHT', 1080))  # never download more than this
+    INFO_CACHE_SIZE = int(os.getenv('INFO_CACHE_SIZE', 64))  # extracted URLs kept for the download
+    INFO_CACHE_TTL = int(os.getenv('INFO_CACHE_TTL', 1800))  # format URLs expire, so don't keep them long
+    YTDL_POOL_SIZE = int(os.getenv('YTDL_POOL_SIZE', 4))  # long-lived YoutubeDL instances
+    YTDL_CONCURRENT_FRAGMENTS = int(os.getenv('YTDL_CONCURRENT_FRAGMENTS', 4))  # parallel HLS/DASH fragment connections per download
+    YTDL_HTTP_CHUNK_SIZE = int(os.getenv('YTDL_HTTP_CHUNK_SIZE', 10485760))  # range request size for progressive downloads, 0 = one request
+    YTDL_MAX_CONNECTIONS_PER_HOST = int(os.getenv('YTDL_MAX_CONNECTIONS_PER_HOST', 8))  # across all running downloads
+    YTDL_PROCESS_WORKERS = int(os.getenv('YTDL_PROCESS_WORKERS', 0))  # 0 runs yt-dlp in threads of the bot process
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # 8MB, multiple of 256KB
+    UPLOAD_MAX_RETRIES = int(os.getenv('UPLOAD_MAX_RETRIES', 5))
+    STREAM_UPLOADS = os.getenv('STREAM_UPLOADS', 'False').lower() == 'true'
+    STREAM_BUFFER_CHUNKS = int(os.getenv('STREAM_BUFFER_CHUNKS', 16))  # 1MB Telegram chunks
+    TELEGRAM_DOWNLOAD_CONNECTIONS = int(os.getenv('TELEGRAM_DOWNLOAD_CONNECTIONS', 4))  # ranges of one file fetched at once, one stream each
+    TELEGRAM_TRANSMISSIONS_PER_CLIENT = int(os.getenv('TELEGRAM_TRANSMISSIONS_PER_CLIENT', TELEGRAM_DOWNLOAD_CONNECTIONS))  # media streams one session runs at once, pyrogram's default is 1
+    MEDIA_CLIENTS = int(os.getenv('MEDIA_CLIENTS', 2))  # extra bot sessions for media transfer, 0 = use the main client
+    
+    # Outbound Telegram Messages
+    OUTBOX_CHAT_PER_SECOND = float(os.getenv('OUTBOX_CHAT_PER_SECOND', 1))  # per private chat
+    OUTBOX_GROUP_PER_MINUTE = int(os.getenv('OUTBOX_GROUP_PER_MINUTE', 20))  # per group or channel
+    OUTBOX_GLOBAL_PER_SECOND = int(os.getenv('OUTBOX_GLOBAL_PER_SECOND', 25))  # across all chats, per process
+    
+    # Progress Reporting
+    PROGRESS_UPDATE_INTERVAL = int(os.getenv('PROGRESS_UPDATE_INTERVAL', 5))  # seconds between edits of one status message
+    PROGRESS_CHAT_EDITS_PER_MINUTE = int(os.getenv('PROGRESS_CHAT_EDITS_PER_MINUTE', 20))  # shared by all jobs in a chat
+    
+    # Temp Disk Space
+    DISK_FREE_MARGIN = int(os.getenv('DISK_FREE_MARGIN', 512 * 1024 * 1024))  # always keep this much free on the temp volume
+    DISK_DEFAULT_RESERVATION = int(os.getenv('DISK_DEFAULT_RESERVATION', 500 * 1024 * 1024))  # for downloads of unknown size
+    DISK_WAIT_INTERVAL = int(os.getenv('DISK_WAIT_INTERVAL', 30))  # seconds between free space checks while waiting
+    DISK_RESERVATION_LEASE = int(os.getenv('DISK_RESERVATION_LEASE', 300))  # reservations of a crashed process stop counting after this
+    TEMP_FILE_MAX_AGE = int(os.getenv('TEMP_FILE_MAX_AGE', 6 * 3600))  # stray temp files older than this are removed
+    JANITOR_INTERVAL = int(os.getenv('JANITOR_INTERVAL', 3600))
+    
+    # Job Scheduling
+    MAX_CONCURRENT_ANALYSES = int(os.getenv('MAX_CONCURRENT_ANALYSES', 4))
+    MAX_CONCURRENT_DOWNLOADS = int(os.getenv('MAX_CONCURRENT_DOWNLOADS', 3))
+    MAX_CONCURRENT_UPLOADS = int(os.getenv('MAX_CONCURRENT_UPLOADS', 2))
+    MAX_QUEUED_JOBS_PER_USER = int(os.getenv('MAX_QUEUED_JOBS_PER_USER', 50))
+    
+    # Worker Processes
+    RUN_MODE = os.getenv('RUN_MODE', 'standalone')  # standalone or frontend (jobs run by worker.py)
+    JOB_QUEUE_BACKEND = os.getenv('JOB_QUEUE_BACKEND', 'sqlite')  # sqlite or redis
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', 2))
+    JOB_CLAIM_TIMEOUT = int(os.getenv('JOB_CLAIM_TIMEOUT', 300))
     
     # App Configuration
     DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
@@ -84,7 +149,7 @@ class Config:
             raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
         
         # Create directories
-        for directory in [cls.CREDENTIALS_DIR, cls.SESSION_DIR, cls.TEMP_DIR]:
+        for directory in [cls.CREDENTIALS_DIR, cls.SESSION_DIR, cls.TEMP_DIR, cls.JOBS_DIR, cls.STATE_DIR, cls.UPLOAD_SESSION_DIR]:
             directory.mkdir(parents=True, exist_ok=True)
         
         # Create credential files from environment variables
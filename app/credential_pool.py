@@ -0,0 +1,225 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google.oauth2 import service_account
+
+from .config import Config
+from .quota import QuotaLedger
+
+logger = logging.getLogger(__name__)
+
+# 403 reasons that mean the project is out of quota rather than forbidden
+QUOTA_ERROR_REASONS = ('quotaExceeded', 'uploadLimitExceeded', 'dailyLimitExceeded', 'rateLimitExceeded')
+
+class CredentialFailure(Exception):
+    """Raised when Google rejects a credential with 401 or 403"""
+
+    def __init__(self, message: str, status: int, content: str = ''):
+        super().__init__(message)
+        self.status = status
+        self.content = content
+
+
+class PooledCredential:
+    """One set of Google credentials with its own quota, health and load"""
+
+    def __init__(self, name: str, kind: str, credentials, token_file: Path = None):
+        self.name = name
+        self.kind = kind
+        self.credentials = credentials
+        self.token_file = token_file
+        self.quota = QuotaLedger(Config.QUOTA_DIR / f"{name}.json")
+        self.in_flight = 0
+        self.unhealthy_until = 0
+        self.last_error = None
+
+    @property
+    def auth_method(self) -> str:
+        return "Service Account" if self.kind == 'service_account' else "OAuth 2.0"
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def save_token(self):
+        """Persist refreshed OAuth credentials to their token file"""
+        if self.kind == 'oauth' and self.token_file:
+            self.token_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.token_file, 'w') as f:
+                f.write(self.credentials.to_json())
+
+
+class QuotaReservation:
+    """Quota units one upload holds on a credential until it is charged or given back"""
+
+    def __init__(self, member: PooledCredential, units: int, key: str = None):
+        self.member = member
+        self.units = units
+        self.key = key
+        self.committed = False
+        self.released = False
+
+
+class CredentialPool:
+    """Spread uploads over several OAuth tokens and service accounts.
+
+    The configured service account and token.json come first, followed by
+    every JSON file in CREDENTIAL_POOL_DIR. Each credential normally belongs
+    to its own Google Cloud project and so has its own daily quota.
+    """
+
+    def __init__(self, scopes: list):
+        self.scopes = scopes
+        self.members = []
+        self._lock = threading.Lock()
+
+    def _load_oauth(self, name: str, token_file: Path):
+        """Load an OAuth token, refreshing it if it has expired"""
+        credentials = Credentials.from_authorized_user_file(str(token_file), self.scopes)
+        member = PooledCredential(name, 'oauth', credentials, token_file)
+        if not credentials.valid:
+            if not (credentials.expired and credentials.refresh_token):
+                raise ValueError("token is invalid and cannot be refreshed")
+            credentials.refresh(Request())
+            member.save_token()
+            logger.info(f"OAuth credentials {name} refreshed successfully")
+        return member
+
+    def _load_file(self, path: Path):
+        """Load a pool file, telling service account keys and OAuth tokens apart"""
+        with open(path) as f:
+            info = json.load(f)
+        if info.get('type') == 'service_account':
+            credentials = service_account.Credentials.from_service_account_info(info, scopes=self.scopes)
+            return PooledCredential(path.stem, 'service_account', credentials)
+        return self._load_oauth(path.stem, path)
+
+    def _discover(self) -> list:
+        """Load every configured credential, skipping broken ones"""
+        members = []
+
+        try:
+            if Config.GOOGLE_SERVICE_ACCOUNT_JSON:
+                credentials = service_account.Credentials.from_service_account_info(
+                    json.loads(Config.GOOGLE_SERVICE_ACCOUNT_JSON), scopes=self.scopes
+                )
+                members.append(PooledCredential('service_account', 'service_account', credentials))
+            elif Config.SERVICE_ACCOUNT_FILE.exists():
+                credentials = service_account.Credentials.from_service_account_file(
+                    str(Config.SERVICE_ACCOUNT_FILE), scopes=self.scopes
+                )
+                members.append(PooledCredential('service_account', 'service_account', credentials))
+        except Exception as e:
+            logger.warning(f"Service account authentication failed: {e}")
+
+        if Config.TOKEN_FILE.exists():
+            try:
+                members.append(self._load_oauth('oauth', Config.TOKEN_FILE))
+            except Exception as e:
+                logger.warning(f"OAuth authentication failed: {e}")
+
+        if Config.CREDENTIAL_POOL_DIR.exists():
+            for path in sorted(Config.CREDENTIAL_POOL_DIR.glob('*.json')):
+                try:
+                    members.append(self._load_file(path))
+                except Exception as e:
+                    logger.warning(f"Skipping pool credential {path.name}: {e}")
+
+        return members
+
+    def load(self) -> int:
+        """(Re)load the pool, keeping load and health of credentials we already had"""
+        members = self._discover()
+        with self._lock:
+            known = {member.name: member for member in self.members}
+            for index, member in enumerate(members):
+                existing = known.get(member.name)
+                if existing:
+                    existing.credentials = member.credentials
+                    existing.token_file = member.token_file
+                    existing.unhealthy_until = 0
+                    members[index] = existing
+            self.members = members
+
+        logger.info(f"Credential pool: {', '.join(m.name for m in members) or 'empty'}")
+        return len(members)
+
+    def get(self, name: str) -> PooledCredential:
+        """Get a credential by name, or None"""
+        for member in self.members:
+            if member.name == name:
+                return member
+        return None
+
+    def primary(self) -> PooledCredential:
+        """Get the first healthy credential, used for account-level API calls"""
+        for member in self.members:
+            if member.healthy:
+                return member
+        return self.members[0] if self.members else None
+
+    def acquire(self, units: int, exclude=()) -> QuotaReservation:
+        """Reserve units on the least-loaded healthy credential that can pay for them"""
+        with self._lock:
+            candidates = [m for m in self.members if m.healthy and m not in exclude]
+            candidates.sort(key=lambda m: (m.in_flight, -m.quota.remaining()))
+            for member in candidates:
+                key = member.quota.reserve(units)
+                if key:
+                    member.in_flight += 1
+                    return QuotaReservation(member, units, key)
+        return None
+
+    async def keep_lease(self, reservation: QuotaReservation):
+        """Renew a reservation's lease in the shared ledger until cancelled"""
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(Config.QUOTA_RESERVATION_LEASE / 3)
+            if reservation.committed or reservation.released or not reservation.key:
+                return
+            try:
+                await loop.run_in_executor(None, reservation.member.quota.renew, reservation.key)
+            except Exception as e:
+                logger.warning(f"Failed to renew quota reservation on {reservation.member.name}: {e}")
+
+    def commit(self, reservation: QuotaReservation, method: str):
+        """Charge an API call to a reservation, turning its reserved units into used ones"""
+        with self._lock:
+            # Only the first call is paid from the reservation, e.g. a recreated session is charged anew
+            key = None if reservation.committed or reservation.released else reservation.key
+            reservation.committed = True
+        reservation.member.quota.commit(method, key)
+
+    def release(self, reservation: QuotaReservation):
+        """Give back a reservation taken with acquire(), returning its units if they were not charged"""
+        with self._lock:
+            if reservation.released:
+                return
+            reservation.released = True
+            member = reservation.member
+            if not reservation.committed and reservation.key:
+                member.quota.release(reservation.key)
+            member.in_flight = max(0, member.in_flight - 1)
+
+    def report_failure(self, member: PooledCredential, status: int, content: str = ''):
+        """Take a credential out of rotation after Google rejected it"""
+        member.last_error = f"HTTP {status}"
+        if status == 403 and any(reason in content for reason in QUOTA_ERROR_REASONS):
+            member.quota.exhaust()
+        else:
+            member.unhealthy_until = time.monotonic() + Config.CREDENTIAL_COOLDOWN
+            logger.warning(f"Credential {member.name} failed with HTTP {status}, "
+                           f"skipping it for {Config.CREDENTIAL_COOLDOWN}s")
+
+    def used(self) -> int:
+        """Get the quota units spent today across the pool"""
+        return sum(member.quota.used() for member in self.members)
+
+    def daily_limit(self) -> int:
+        """Get the daily quota of the whole pool"""
+        return sum(member.quota.daily_limit for member in self.members)
@@ -0,0 +1,202 @@
+import time
+import shutil
+import sqlite3
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Leftovers of interrupted yt-dlp downloads, including fragments like x.mp4.part-Frag12
+PARTIAL_MARKERS = ('.part', '.ytdl', '.temp')
+
+def directory_size(path: Path) -> int:
+    """Get the bytes used by the files under a directory"""
+    if not path.exists():
+        return 0
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+
+
+class DiskBudget:
+    """Admission control for downloads into the temp volume.
+
+    A job reserves the bytes it expects to write before it starts
+    downloading and waits while free space minus the outstanding
+    reservations would drop below DISK_FREE_MARGIN. Bytes a job has
+    already written to its workspace count against free space, so only
+    the remainder of its reservation is held on top.
+
+    Reservations are rows in a SQLite table on the state volume, so every
+    worker process sharing the temp volume sees them, and checking and
+    taking space is one transaction. A process renews the lease of its
+    rows while it holds them; rows of a process that died stop counting
+    once their lease of DISK_RESERVATION_LEASE seconds runs out.
+    """
+
+    def __init__(self, directory: Path = None, margin: int = None, db_path: Path = None):
+        self.directory = Path(directory or Config.TEMP_DIR)
+        self.margin = Config.DISK_FREE_MARGIN if margin is None else margin
+        self.db_path = Path(db_path or Config.DISK_RESERVATION_FILE)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._released = asyncio.Event()
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA busy_timeout=5000')
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS reservations (
+                job_id TEXT PRIMARY KEY,
+                workspace TEXT NOT NULL,
+                expected INTEGER NOT NULL,
+                renewed_at REAL NOT NULL
+            )
+        """)
+
+    def _outstanding(self) -> int:
+        cutoff = time.time() - Config.DISK_RESERVATION_LEASE
+        rows = self.conn.execute(
+            'SELECT workspace, expected FROM reservations WHERE renewed_at >= ?', (cutoff,)
+        ).fetchall()
+        return sum(max(0, expected - directory_size(Path(workspace))) for workspace, expected in rows)
+
+    def _available(self) -> int:
+        free = shutil.disk_usage(self.directory).free
+        return free - self._outstanding() - self.margin
+
+    def outstanding(self) -> int:
+        """Get the reserved bytes, of every process, that are not on disk yet"""
+        with self._lock:
+            return self._outstanding()
+
+    def _try_reserve(self, job_id: str, workspace: Path, expected: int) -> int:
+        """Take the space if it is available; returns what was available before. Blocking"""
+        with self._lock:
+            # Hold the write lock so no other process reserves between the check and the insert
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.conn.execute(
+                    'DELETE FROM reservations WHERE renewed_at < ? OR job_id = ?',
+                    (time.time() - Config.DISK_RESERVATION_LEASE, job_id)
+                )
+                available = self._available()
+                if expected <= available:
+                    self.conn.execute(
+                        'INSERT INTO reservations (job_id, workspace, expected, renewed_at) VALUES (?, ?, ?, ?)',
+                        (job_id, str(workspace), expected, time.time())
+                    )
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            return available
+
+    def _renew(self, job_id: str):
+        with self._lock:
+            self.conn.execute('UPDATE reservations SET renewed_at = ? WHERE job_id = ?', (time.time(), job_id))
+
+    def _remove(self, job_id: str):
+        with self._lock:
+            self.conn.execute('DELETE FROM reservations WHERE job_id = ?', (job_id,))
+
+    async def _keep_lease(self, job_id: str):
+        """Renew a reservation's lease until cancelled"""
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(Config.DISK_RESERVATION_LEASE / 3)
+            try:
+                await loop.run_in_executor(None, self._renew, job_id)
+            except Exception as e:
+                logger.warning(f"Failed to renew disk reservation of job {job_id}: {e}")
+
+    @asynccontextmanager
+    async def reserve(self, job_id: str, workspace: Path, expected: int, on_wait=None):
+        """Hold `expected` bytes for a job's download into workspace.
+
+        on_wait, if given, is awaited once when the job has to wait for space.
+        """
+        capacity = shutil.disk_usage(self.directory).total - self.margin
+        if expected > capacity:
+            raise Exception(f"Not enough disk space: {expected/(1024*1024):.0f} MB needed, "
+                            f"the temp volume holds {capacity/(1024*1024):.0f} MB")
+
+        loop = asyncio.get_event_loop()
+        waited = False
+        while True:
+            available = await loop.run_in_executor(None, self._try_reserve, job_id, workspace, expected)
+            if expected <= available:
+                break
+
+            if not waited:
+                logger.info(f"Job {job_id} waits for disk space: needs {expected/(1024*1024):.0f} MB, "
+                            f"{max(0, available)/(1024*1024):.0f} MB available")
+                if on_wait:
+                    await on_wait()
+                waited = True
+
+            # Space frees up when another reservation ends, or other processes clean up
+            self._released.clear()
+            try:
+                await asyncio.wait_for(self._released.wait(), Config.DISK_WAIT_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+        lease = asyncio.create_task(self._keep_lease(job_id))
+        try:
+            yield
+        finally:
+            lease.cancel()
+            self._remove(job_id)
+            self._released.set()
+
+
+def clean_temp_dir(job_store) -> int:
+    """Remove files in TEMP_DIR that no unfinished job owns; returns the bytes freed.
+
+    Workspaces of finished or unknown jobs are removed outright. Workspaces
+    of unfinished jobs keep recent partial downloads, which yt-dlp resumes,
+    and lose those older than TEMP_FILE_MAX_AGE. Loose files directly in
+    TEMP_DIR go once they reach that age too. Durable state in STATE_DIR is
+    never touched.
+    """
+    active = {job['id'] for job in job_store.unfinished()}
+    cutoff = time.time() - Config.TEMP_FILE_MAX_AGE
+    freed = 0
+
+    def remove_stale(path: Path) -> int:
+        try:
+            stat = path.stat()
+            if stat.st_mtime >= cutoff:
+                return 0
+            path.unlink()
+        except FileNotFoundError:
+            return 0
+        logger.info(f"Removed stale temp file {path.name} ({stat.st_size/(1024*1024):.1f} MB)")
+        return stat.st_size
+
+    if Config.JOBS_DIR.exists():
+        for workspace in Config.JOBS_DIR.iterdir():
+            if workspace.name in active:
+                if workspace.is_dir():
+                    for path in workspace.iterdir():
+                        if path.is_file() and any(marker in path.name for marker in PARTIAL_MARKERS):
+                            freed += remove_stale(path)
+                continue
+            size = directory_size(workspace) if workspace.is_dir() else workspace.stat().st_size
+            if workspace.is_dir():
+                shutil.rmtree(workspace, ignore_errors=True)
+            else:
+                workspace.unlink(missing_ok=True)
+            freed += size
+            logger.info(f"Removed orphaned job workspace {workspace.name} ({size/(1024*1024):.1f} MB)")
+
+    for path in Config.TEMP_DIR.iterdir():
+        if path in (Config.STATE_DIR, Config.JOBS_DIR) or not path.is_file():
+            continue
+        freed += remove_stale(path)
+
+    return freed
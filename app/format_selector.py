@@ -0,0 +1,136 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Audio that can be merged into a video container without converting it
+AUDIO_EXTENSIONS = {'mp4': 'm4a', 'webm': 'webm'}
+
+# Protocols whose output yt-dlp fixes up with an ffmpeg remux after downloading
+REMUX_PROTOCOLS = ('m3u8', 'm3u8_native')
+
+def estimate_bytes(fmt: dict) -> int:
+    """Get the expected size of a format, or None when the extractor gives no hint"""
+    return fmt.get('filesize') or fmt.get('filesize_approx')
+
+
+class FormatSelector:
+    """yt-dlp format selector that ranks formats by what a job costs to move.
+
+    YouTube re-encodes every upload, so beyond the configured quality floor
+    extra bytes only cost download time, disk and upload time. Formats are
+    ranked by whether they need an ffmpeg merge, whether they need a remux,
+    and then by their estimated size. Pre-muxed formats that meet the floor
+    always win over merged ones.
+
+    An instance is passed as the 'format' option; yt-dlp calls it with the
+    formats of each video and downloads the first format it yields.
+    """
+
+    def __init__(self, min_height: int, max_height: int, max_bytes: int, merge_output_format: str = 'mp4'):
+        self.min_height = min_height
+        self.max_height = max_height
+        self.max_bytes = max_bytes
+        self.merge_output_format = merge_output_format
+
+    def __call__(self, ctx: dict):
+        formats = ctx.get('formats') or []
+        if not formats:
+            return
+
+        candidates = self._candidates(formats)
+        chosen = self._rank(candidates)
+        if chosen is None:
+            if not candidates:
+                # No video with sound at all, leave it to yt-dlp's own idea of best
+                logger.info("No format has both video and audio, using the best available")
+                yield formats[-1]
+                return
+            # Still never pick a video-only format, that would upload without sound
+            logger.info("No format fits the size and quality limits, using the best available")
+            chosen = self._best(candidates)
+
+        size = chosen['filesize_approx']
+        size_text = f"{size/(1024*1024):.1f} MB" if size else "unknown size"
+        logger.info(f"Selected format {chosen['format']['format_id']} ({chosen['height'] or '?'}p, {size_text})")
+        yield chosen['format']
+
+    def _candidates(self, formats: list) -> list:
+        """Build every downloadable option: pre-muxed formats and video+audio pairs"""
+        videos = [f for f in formats if f.get('vcodec') != 'none']
+        audios = [f for f in formats if f.get('vcodec') == 'none' and f.get('acodec') != 'none']
+
+        candidates = []
+        for video in videos:
+            if video.get('acodec') != 'none':
+                candidates.append(self._candidate(video, [video]))
+                continue
+
+            audio = self._audio_for(video, audios)
+            if audio is None:
+                continue
+            # Describe the merged file like yt-dlp does, so later checks see real values
+            merged = {
+                'format_id': f"{video['format_id']}+{audio['format_id']}",
+                'ext': self.merge_output_format or video.get('ext'),
+                'requested_formats': [video, audio],
+                'protocol': f"{video.get('protocol')}+{audio.get('protocol')}",
+                'width': video.get('width'),
+                'height': video.get('height'),
+                'fps': video.get('fps'),
+                'vcodec': video.get('vcodec'),
+                'acodec': audio.get('acodec'),
+            }
+            candidates.append(self._candidate(merged, [video, audio]))
+        return candidates
+
+    @staticmethod
+    def _audio_for(video: dict, audios: list) -> dict:
+        """Pick the best audio that merges into the video's container, else the best of any"""
+        matching = [a for a in audios if a.get('ext') == AUDIO_EXTENSIONS.get(video.get('ext'))]
+        # yt-dlp orders formats from worst to best
+        pool = matching or audios
+        return pool[-1] if pool else None
+
+    @staticmethod
+    def _candidate(fmt: dict, parts: list) -> dict:
+        sizes = [estimate_bytes(part) for part in parts]
+        size = sum(sizes) if all(sizes) else None
+        if size and len(parts) > 1:
+            # Lets the size checks see the estimate for merged formats too
+            fmt['filesize_approx'] = size
+        return {
+            'format': fmt,
+            'height': parts[0].get('height'),
+            'filesize_approx': size,
+            'needs_merge': len(parts) > 1,
+            'needs_remux': any(part.get('protocol') in REMUX_PROTOCOLS for part in parts),
+            'tbr': sum(part.get('tbr') or 0 for part in parts),
+        }
+
+    @staticmethod
+    def _best(candidates: list) -> dict:
+        """Get the highest quality candidate regardless of the limits"""
+        return max(candidates, key=lambda c: (c['height'] or 0, c['tbr'], not c['needs_merge']))
+
+    def _rank(self, candidates: list) -> dict:
+        """Get the cheapest candidate that meets the quality floor"""
+        fitting = [
+            c for c in candidates
+            if (c['filesize_approx'] is None or c['filesize_approx'] <= self.max_bytes)
+            and (c['height'] is None or c['height'] <= self.max_height)
+        ]
+        if not fitting:
+            return None
+
+        # A source that never reaches the floor is judged against its best height
+        heights = [c['height'] for c in fitting if c['height']]
+        floor = min(self.min_height, max(heights)) if heights else 0
+        acceptable = [c for c in fitting if c['height'] is None or c['height'] >= floor]
+
+        return min(acceptable, key=lambda c: (
+            c['needs_merge'],
+            c['needs_remux'],
+            c['filesize_approx'] if c['filesize_approx'] is not None else float('inf'),
+            c['tbr'],
+            -(c['height'] or 0),
+        ))
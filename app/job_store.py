@@ -0,0 +1,332 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from uuid import uuid4
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+def open_job_store():
+    """Open the job store selected by JOB_QUEUE_BACKEND"""
+    if Config.JOB_QUEUE_BACKEND == 'redis':
+        return RedisJobStore(Config.REDIS_URL)
+    return JobStore()
+
+class JobStore:
+    """SQLite-backed job state so queued and running jobs survive a crash.
+
+    A job moves through the stages queued -> analyzed -> downloaded -> done
+    (or failed). After a restart unfinished jobs are picked up again from
+    the last stage they completed.
+
+    The database doubles as the local job queue for worker processes on
+    the same host: a worker claims a job by writing its ID into the row,
+    and a user's jobs are never claimed while another one of theirs runs.
+    """
+
+    STAGES = ('queued', 'analyzed', 'downloaded', 'done', 'failed')
+    FINISHED_STAGES = ('done', 'failed')
+
+    COLUMNS = (
+        'id', 'kind', 'user_id', 'chat_id', 'message_id', 'status_message_id',
+        'username', 'url', 'file_name', 'stage', 'file_path', 'file_size',
+        'bytes_done', 'video_info', 'youtube_url', 'error', 'worker_id', 'claimed_at',
+        'content_keys', 'created_at', 'updated_at'
+    )
+    JSON_COLUMNS = ('video_info', 'content_keys')
+
+    def __init__(self, db_path: Path = None):
+        self.db_path = Path(db_path or Config.JOB_DB_FILE)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Worker processes claim jobs from executor threads
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA busy_timeout=5000')
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER,
+                status_message_id INTEGER,
+                username TEXT,
+                url TEXT,
+                file_name TEXT,
+                stage TEXT NOT NULL DEFAULT 'queued',
+                file_path TEXT,
+                file_size INTEGER,
+                bytes_done INTEGER NOT NULL DEFAULT 0,
+                video_info TEXT,
+                youtube_url TEXT,
+                error TEXT,
+                worker_id TEXT,
+                claimed_at TEXT,
+                content_keys TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self._add_missing_columns({'worker_id': 'TEXT', 'claimed_at': 'TEXT', 'content_keys': 'TEXT'})
+        self.conn.execute('CREATE INDEX IF NOT EXISTS jobs_stage ON jobs (stage)')
+
+    def _add_missing_columns(self, columns: dict):
+        """Upgrade databases created before a column existed"""
+        existing = {row['name'] for row in self.conn.execute('PRAGMA table_info(jobs)')}
+        for column, column_type in columns.items():
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+    def create(self, **fields) -> dict:
+        """Insert a new queued job and return it"""
+        now = datetime.now().isoformat()
+        job = {column: None for column in self.COLUMNS}
+        job.update(id=uuid4().hex, stage='queued', bytes_done=0, created_at=now, updated_at=now)
+        job.update(fields)
+
+        with self._lock:
+            self.conn.execute(
+                f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                [self._encode(column, job[column]) for column in self.COLUMNS]
+            )
+        return job
+
+    def update(self, job: dict, **fields):
+        """Update fields of a job, both in the given dict and in the database"""
+        fields['updated_at'] = datetime.now().isoformat()
+        job.update(fields)
+
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        with self._lock:
+            self.conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                [self._encode(column, value) for column, value in fields.items()] + [job['id']]
+            )
+
+    def get(self, job_id: str) -> dict:
+        """Get a job by ID, or None"""
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def unfinished(self) -> list:
+        """Get all jobs that are neither done nor failed, oldest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM jobs WHERE stage NOT IN (?, ?) ORDER BY created_at",
+                self.FINISHED_STAGES
+            ).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def pending(self, user_id: int) -> int:
+        """Get the number of unfinished jobs for a user"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND stage NOT IN (?, ?)",
+                (user_id, *self.FINISHED_STAGES)
+            ).fetchone()
+        return row[0]
+
+    def claim(self, worker_id: str, timeout: float = 5) -> dict:
+        """Claim the oldest unclaimed job, waiting up to timeout seconds; blocking"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self._claim_once(worker_id)
+            if job or time.monotonic() >= deadline:
+                return job
+            time.sleep(min(1, max(0, deadline - time.monotonic())))
+
+    def _claim_once(self, worker_id: str) -> dict:
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.conn.execute(
+                    """
+                    SELECT * FROM jobs
+                    WHERE stage NOT IN (?, ?) AND worker_id IS NULL
+                      AND user_id NOT IN (
+                          SELECT user_id FROM jobs
+                          WHERE worker_id IS NOT NULL AND stage NOT IN (?, ?)
+                      )
+                    ORDER BY created_at LIMIT 1
+                    """,
+                    self.FINISHED_STAGES * 2
+                ).fetchone()
+                if row:
+                    now = datetime.now().isoformat()
+                    self.conn.execute(
+                        "UPDATE jobs SET worker_id = ?, claimed_at = ? WHERE id = ?",
+                        (worker_id, now, row['id'])
+                    )
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+
+        if not row:
+            return None
+        job = self._decode(row)
+        job['worker_id'] = worker_id
+        return job
+
+    def heartbeat(self, worker_id: str):
+        """Mark a worker's claimed jobs as still being worked on"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE jobs SET claimed_at = ? WHERE worker_id = ? AND stage NOT IN (?, ?)",
+                (datetime.now().isoformat(), worker_id, *self.FINISHED_STAGES)
+            )
+
+    def release(self, worker_id: str):
+        """Put a worker's unfinished jobs back in the queue"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE jobs SET worker_id = NULL, claimed_at = NULL WHERE worker_id = ? AND stage NOT IN (?, ?)",
+                (worker_id, *self.FINISHED_STAGES)
+            )
+
+    def requeue_stale(self, timeout: int):
+        """Put back jobs whose worker stopped sending heartbeats"""
+        cutoff = (datetime.now() - timedelta(seconds=timeout)).isoformat()
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET worker_id = NULL, claimed_at = NULL "
+                "WHERE worker_id IS NOT NULL AND claimed_at < ? AND stage NOT IN (?, ?)",
+                (cutoff, *self.FINISHED_STAGES)
+            )
+        if cursor.rowcount:
+            logger.warning(f"Requeued {cursor.rowcount} job(s) from unresponsive workers")
+
+    def _encode(self, column: str, value):
+        if column in self.JSON_COLUMNS and value is not None:
+            return json.dumps(value)
+        return value
+
+    def _decode(self, row: sqlite3.Row) -> dict:
+        job = dict(row)
+        for column in self.JSON_COLUMNS:
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+
+class RedisJobStore:
+    """Job store and queue on a Redis-compatible server, for workers on several hosts.
+
+    Jobs are hashes with JSON-encoded fields. Queued job IDs wait in a list
+    and are moved atomically into a per-worker list when claimed, so jobs of
+    a worker that dies can be put back. Jobs are taken in arrival order;
+    unlike the SQLite store, two jobs of one user may run at the same time.
+    """
+
+    PREFIX = 'ytbot'
+    FINISHED_STAGES = JobStore.FINISHED_STAGES
+    COLUMNS = JobStore.COLUMNS
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("JOB_QUEUE_BACKEND=redis requires the 'redis' package")
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.queue_key = f"{self.PREFIX}:queue"
+        self.unfinished_key = f"{self.PREFIX}:unfinished"
+        self.workers_key = f"{self.PREFIX}:workers"
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.PREFIX}:job:{job_id}"
+
+    def _user_key(self, user_id: int) -> str:
+        return f"{self.PREFIX}:user:{user_id}"
+
+    def _claimed_key(self, worker_id: str) -> str:
+        return f"{self.PREFIX}:claimed:{worker_id}"
+
+    def _heartbeat_key(self, worker_id: str) -> str:
+        return f"{self.PREFIX}:worker:{worker_id}"
+
+    def create(self, **fields) -> dict:
+        """Store a new queued job, push it on the queue and return it"""
+        now = datetime.now().isoformat()
+        job = {column: None for column in self.COLUMNS}
+        job.update(id=uuid4().hex, stage='queued', bytes_done=0, created_at=now, updated_at=now)
+        job.update(fields)
+
+        pipe = self.redis.pipeline()
+        pipe.hset(self._job_key(job['id']), mapping={k: json.dumps(v) for k, v in job.items()})
+        pipe.sadd(self.unfinished_key, job['id'])
+        pipe.sadd(self._user_key(job['user_id']), job['id'])
+        pipe.lpush(self.queue_key, job['id'])
+        pipe.execute()
+        return job
+
+    def update(self, job: dict, **fields):
+        """Update fields of a job, both in the given dict and on the server"""
+        fields['updated_at'] = datetime.now().isoformat()
+        job.update(fields)
+
+        pipe = self.redis.pipeline()
+        pipe.hset(self._job_key(job['id']), mapping={k: json.dumps(v) for k, v in fields.items()})
+        if fields.get('stage') in self.FINISHED_STAGES:
+            pipe.srem(self.unfinished_key, job['id'])
+            pipe.srem(self._user_key(job['user_id']), job['id'])
+            if job.get('worker_id'):
+                pipe.lrem(self._claimed_key(job['worker_id']), 0, job['id'])
+        pipe.execute()
+
+    def get(self, job_id: str) -> dict:
+        """Get a job by ID, or None"""
+        data = self.redis.hgetall(self._job_key(job_id))
+        return {k: json.loads(v) for k, v in data.items()} if data else None
+
+    def unfinished(self) -> list:
+        """Get all jobs that are neither done nor failed, oldest first"""
+        jobs = [self.get(job_id) for job_id in self.redis.smembers(self.unfinished_key)]
+        return sorted((job for job in jobs if job), key=lambda job: job['created_at'])
+
+    def pending(self, user_id: int) -> int:
+        """Get the number of unfinished jobs for a user"""
+        return self.redis.scard(self._user_key(user_id))
+
+    def claim(self, worker_id: str, timeout: float = 5) -> dict:
+        """Claim the oldest queued job, waiting up to timeout seconds; blocking"""
+        self.redis.sadd(self.workers_key, worker_id)
+        job_id = self.redis.blmove(self.queue_key, self._claimed_key(worker_id), timeout, 'RIGHT', 'LEFT')
+        if not job_id:
+            return None
+
+        job = self.get(job_id)
+        if not job:
+            self.redis.lrem(self._claimed_key(worker_id), 0, job_id)
+            return None
+        self.update(job, worker_id=worker_id, claimed_at=datetime.now().isoformat())
+        return job
+
+    def heartbeat(self, worker_id: str):
+        """Mark a worker as alive"""
+        self.redis.sadd(self.workers_key, worker_id)
+        self.redis.set(self._heartbeat_key(worker_id), datetime.now().isoformat(), ex=Config.JOB_CLAIM_TIMEOUT)
+
+    def release(self, worker_id: str):
+        """Put a worker's unfinished jobs back at the front of the queue"""
+        while self.redis.lmove(self._claimed_key(worker_id), self.queue_key, 'LEFT', 'RIGHT'):
+            pass
+
+    def requeue_stale(self, timeout: int):
+        """Put back jobs of workers whose heartbeat expired"""
+        for worker_id in self.redis.smembers(self.workers_key):
+            if not self.redis.exists(self._heartbeat_key(worker_id)):
+                if self.redis.llen(self._claimed_key(worker_id)):
+                    logger.warning(f"Requeuing jobs of unresponsive worker {worker_id}")
+                self.release(worker_id)
+                self.redis.srem(self.workers_key, worker_id)
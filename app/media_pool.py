@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from pyrogram import Client
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+class MediaClientPool:
+    """Extra sessions of the bot that carry media transfers only.
+
+    Every session logs in with the same bot token but receives no updates,
+    so large downloads never queue behind, or in front of, the update
+    handling and replies of the main client. A session runs up to its
+    max_concurrent_transmissions streams at once; each transfer connection
+    takes a free slot on the session with the lowest load relative to that
+    capacity, so connections never queue inside pyrogram. Without any
+    started session, transfers fall back to the main client.
+    """
+
+    def __init__(self, name: str, size: int, fallback: Client):
+        self.fallback = fallback
+        self.clients = [
+            Client(
+                f"{name}_media_{index}",
+                api_id=Config.API_ID,
+                api_hash=Config.API_HASH,
+                bot_token=Config.BOT_TOKEN,
+                workdir=str(Config.SESSION_DIR),
+                no_updates=True,
+                max_concurrent_transmissions=Config.TELEGRAM_TRANSMISSIONS_PER_CLIENT
+            )
+            for index in range(size)
+        ]
+        self._load = {}
+        self._fallback_load = {fallback: 0}
+        self._freed = asyncio.Condition()
+
+    async def start(self):
+        """Log in the media sessions, leaving out any that fail"""
+        for client in self.clients:
+            try:
+                await client.start()
+                self._load[client] = 0
+            except Exception as e:
+                logger.warning(f"Media client {client.name} failed to start: {e}")
+        if self.clients:
+            logger.info(f"Started {len(self._load)}/{len(self.clients)} media clients")
+
+    async def stop(self):
+        for client in list(self._load):
+            try:
+                await client.stop()
+            except Exception as e:
+                logger.warning(f"Media client {client.name} failed to stop: {e}")
+        self._load.clear()
+
+    @staticmethod
+    def _free(load: dict, client) -> int:
+        return client.max_concurrent_transmissions - load[client]
+
+    @asynccontextmanager
+    async def acquire(self, connections: int = 1):
+        """Get a client for each of up to `connections` transfer connections, least loaded first.
+
+        Waits while every slot is taken. With fewer free slots than asked
+        for, the caller gets as many as are free, at least one.
+        """
+        load = self._load or self._fallback_load
+        assigned = []
+        async with self._freed:
+            await self._freed.wait_for(lambda: any(self._free(load, client) > 0 for client in load))
+            for _ in range(connections):
+                candidates = [client for client in load if self._free(load, client) > 0]
+                if not candidates:
+                    break
+                client = min(candidates, key=lambda c: load[c] / c.max_concurrent_transmissions)
+                load[client] += 1
+                assigned.append(client)
+        try:
+            yield assigned
+        finally:
+            for client in assigned:
+                if client in load:
+                    load[client] -= 1
+            async with self._freed:
+                self._freed.notify_all()
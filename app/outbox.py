@@ -0,0 +1,208 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from pyrogram.enums import ChatType
+from pyrogram.errors import FloodWait, MessageNotModified
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Recent send latencies kept for the metrics
+LATENCY_WINDOW = 200
+METRICS_LOG_INTERVAL = 60
+
+class TokenBuckets:
+    """Token buckets by key, refilled at `rate` tokens per second up to `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+
+    def take(self, key) -> float:
+        """Spend one token; returns 0, or the seconds to wait before one is available"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            self._buckets[key] = (tokens - 1, now)
+            return 0
+        self._buckets[key] = (tokens, now)
+        return (1 - tokens) / self.rate
+
+    def block(self, key, seconds: float):
+        """Empty a bucket for the next `seconds`, e.g. after a FloodWait"""
+        self._buckets[key] = (-seconds * self.rate, time.monotonic())
+
+    async def acquire(self, key):
+        """Wait for a token and spend it"""
+        wait = self.take(key)
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self.take(key)
+
+
+class _Outgoing:
+    """A queued send or edit and the future its callers wait on"""
+
+    def __init__(self, chat_id: int, message_id: int, text: str, kwargs: dict):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.kwargs = kwargs
+        self.future = asyncio.get_event_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class Outbox:
+    """Central queue for the messages the bot sends and edits.
+
+    Each chat's messages go out in order, paced by a per-chat token bucket
+    (Telegram allows about one message a second in private chats and 20 a
+    minute in groups) and a global one shared by all chats. A FloodWait
+    holds the chat back for the requested time and the message is sent
+    again afterwards instead of failing its caller. An edit of a message
+    that already has an edit waiting replaces the waiting edit's text, so
+    only the newest state is sent and every caller gets its result.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.private_budget = TokenBuckets(Config.OUTBOX_CHAT_PER_SECOND, 3)
+        self.group_budget = TokenBuckets(Config.OUTBOX_GROUP_PER_MINUTE / 60, 3)
+        self.global_budget = TokenBuckets(Config.OUTBOX_GLOBAL_PER_SECOND, Config.OUTBOX_GLOBAL_PER_SECOND)
+        self._queues = {}
+        self._pending_edits = {}
+        self._senders = {}
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.sent = 0
+        self.merged = 0
+        self.flood_waits = 0
+        self._metrics_logged = time.monotonic()
+
+    async def send(self, chat_id: int, text: str, **kwargs):
+        """Queue a new message; returns the sent Message"""
+        return await self._submit(_Outgoing(chat_id, None, text, kwargs))
+
+    async def edit_message(self, chat_id: int, message_id: int, text: str, **kwargs):
+        """Queue an edit, merged with an edit of the same message that is still waiting"""
+        entry = self._pending_edits.get((chat_id, message_id))
+        if entry:
+            entry.text = text
+            entry.kwargs = kwargs
+            self.merged += 1
+            return await asyncio.shield(entry.future)
+        return await self._submit(_Outgoing(chat_id, message_id, text, kwargs))
+
+    def reply(self, message, text: str, **kwargs):
+        """Queue a reply like Message.reply_text, quoting in groups only"""
+        if message.chat.type != ChatType.PRIVATE:
+            kwargs.setdefault('reply_to_message_id', message.id)
+        return self.send(message.chat.id, text, **kwargs)
+
+    def edit(self, message, text: str, **kwargs):
+        """Queue an edit like Message.edit_text"""
+        return self.edit_message(message.chat.id, message.id, text, **kwargs)
+
+    def metrics(self) -> dict:
+        """Get queue depth and send latency figures"""
+        latencies = list(self._latencies)
+        return {
+            'queue_depth': sum(len(queue) for queue in self._queues.values()),
+            'busy_chats': len(self._queues),
+            'sent': self.sent,
+            'merged_edits': self.merged,
+            'flood_waits': self.flood_waits,
+            'latency_avg': sum(latencies) / len(latencies) if latencies else 0,
+            'latency_max': max(latencies, default=0),
+        }
+
+    async def _submit(self, entry: _Outgoing):
+        chat_id = entry.chat_id
+        self._queues.setdefault(chat_id, deque()).append(entry)
+        if entry.message_id is not None:
+            self._pending_edits[(chat_id, entry.message_id)] = entry
+        if chat_id not in self._senders:
+            self._senders[chat_id] = asyncio.create_task(self._drain(chat_id))
+        # Callers of merged edits share the future, one cancelled caller must not cancel it
+        return await asyncio.shield(entry.future)
+
+    async def _drain(self, chat_id: int):
+        """Send a chat's queued messages one at a time until its queue is empty"""
+        queue = self._queues[chat_id]
+        budget = self.group_budget if chat_id < 0 else self.private_budget
+        try:
+            while queue:
+                entry = queue[0]
+                await budget.acquire(chat_id)
+                await self.global_budget.acquire(None)
+
+                # From here on a new edit of this message must be queued behind this one
+                key = (chat_id, entry.message_id)
+                if self._pending_edits.get(key) is entry:
+                    del self._pending_edits[key]
+
+                try:
+                    result = await self._deliver(entry)
+                except FloodWait as e:
+                    self.flood_waits += 1
+                    logger.warning(f"FloodWait of {e.value}s in chat {chat_id}, "
+                                   f"rescheduling {len(queue)} queued message(s)")
+                    budget.block(chat_id, e.value)
+                    if entry.message_id is not None:
+                        newer = self._pending_edits.get(key)
+                        if newer is None:
+                            self._pending_edits[key] = entry
+                        else:
+                            # An edit queued meanwhile supersedes this one
+                            queue.popleft()
+                            newer.future.add_done_callback(
+                                lambda future, entry=entry: self._copy_result(future, entry.future)
+                            )
+                    continue
+                except Exception as e:
+                    queue.popleft()
+                    entry.future.set_exception(e)
+                    continue
+
+                queue.popleft()
+                self.sent += 1
+                self._latencies.append(time.monotonic() - entry.enqueued_at)
+                entry.future.set_result(result)
+                self._log_metrics()
+        finally:
+            self._senders.pop(chat_id, None)
+            if not queue:
+                self._queues.pop(chat_id, None)
+
+    @staticmethod
+    def _copy_result(source: asyncio.Future, target: asyncio.Future):
+        if source.cancelled():
+            target.cancel()
+        elif source.exception():
+            target.set_exception(source.exception())
+        else:
+            target.set_result(source.result())
+
+    async def _deliver(self, entry: _Outgoing):
+        if entry.message_id is None:
+            return await self.client.send_message(entry.chat_id, entry.text, **entry.kwargs)
+        try:
+            return await self.client.edit_message_text(entry.chat_id, entry.message_id, entry.text, **entry.kwargs)
+        except MessageNotModified:
+            return None
+
+    def _log_metrics(self):
+        now = time.monotonic()
+        if now - self._metrics_logged < METRICS_LOG_INTERVAL:
+            return
+        self._metrics_logged = now
+        metrics = self.metrics()
+        logger.info(
+            f"Outbox: {metrics['queue_depth']} queued in {metrics['busy_chats']} chat(s), "
+            f"{metrics['sent']} sent, {metrics['merged_edits']} edits merged, "
+            f"{metrics['flood_waits']} FloodWaits, latency avg {metrics['latency_avg']:.2f}s "
+            f"max {metrics['latency_max']:.2f}s"
+        )
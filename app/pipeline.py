@@ -0,0 +1,481 @@
+import asyncio
+import logging
+import shutil
+from pathlib import Path
+from datetime import datetime
+
+from .config import Config
+from .streaming import StreamBuffer
+from .disk_budget import DiskBudget, clean_temp_dir
+from .telegram_download import TelegramDownload
+from .progress import ProgressReporter
+from .quota import API_COSTS, next_reset, seconds_until_reset
+from .upload_ledger import UploadLedger, file_key, url_key, video_key, hash_key
+
+logger = logging.getLogger(__name__)
+
+class JobPipeline:
+    """Runs a job through analyze, download and upload, reporting to its chat.
+
+    Shared by the bot in standalone mode and by worker processes, each
+    passing its own pyrogram client.
+    """
+
+    def __init__(self, app, job_store, youtube_uploader, video_downloader, scheduler, media_pool, outbox):
+        self.app = app
+        self.media_pool = media_pool
+        self.outbox = outbox
+        self.job_store = job_store
+        self.youtube_uploader = youtube_uploader
+        self.video_downloader = video_downloader
+        self.scheduler = scheduler
+        self.upload_ledger = UploadLedger()
+        self.disk_budget = DiskBudget()
+        # Live percentage, speed and ETA in status messages, within Telegram's edit limits
+        self.progress = ProgressReporter(self.update_status)
+
+    async def run_job(self, job: dict):
+        """Run a queued job, starting after its last completed stage"""
+        try:
+            # A downloaded file may have been lost with the temp volume
+            if job['stage'] == 'downloaded' and not Path(job['file_path']).exists():
+                logger.warning(f"Downloaded file for job {job['id']} is gone, downloading again")
+                self.job_store.update(job, stage='queued' if job['kind'] == 'file' else 'analyzed')
+
+            # Check authentication first
+            auth_status = await self.youtube_uploader.check_authentication()
+            if not auth_status:
+                await self.fail_job(
+                    job,
+                    "❌ **Authentication Required**\n\n"
+                    "Please authenticate with YouTube first.\n\n"
+                    "**Options:**\n"
+                    "• Service Account (automatic if configured)\n"
+                    "• OAuth 2.0: Use /start → Setup OAuth",
+                    'Authentication required'
+                )
+                return
+
+            # Hold back jobs whose upload no credential has quota left for
+            upload_cost = API_COSTS['videos.insert']
+            pool = self.youtube_uploader.pool
+            lease = None
+            if not self.youtube_uploader.session_store.get(job['id']):
+                job['reservation'] = await self.wait_for_quota(job, upload_cost)
+                lease = asyncio.create_task(pool.keep_lease(job['reservation']))
+
+            try:
+                if job['kind'] == 'file':
+                    await self.process_video_file(job)
+                else:
+                    await self.process_video_url(job)
+            finally:
+                if lease:
+                    lease.cancel()
+                reservation = job.pop('reservation', None)
+                if reservation:
+                    pool.release(reservation)
+
+        except Exception as e:
+            logger.error(f"Error processing job {job['id']}: {e}")
+            self.job_store.update(job, stage='failed', error=str(e))
+            try:
+                await self.update_status(job, f"❌ **Error:** {str(e)}")
+            except Exception:
+                pass
+
+        # Cleanup once the job is finished; a cancelled job keeps its files for recovery
+        if job.get('file_path'):
+            self.cleanup_temp_file(job['file_path'])
+        shutil.rmtree(self.job_workspace(job), ignore_errors=True)
+
+    def job_workspace(self, job: dict) -> Path:
+        """Directory holding a job's downloads, so concurrent jobs never share files"""
+        return Config.JOBS_DIR / job['id']
+
+    def reserve_disk(self, job: dict, expected: int):
+        """Reserve temp space for a job's download, telling the user if it has to wait"""
+        async def on_wait():
+            await self.update_status(
+                job,
+                "⏳ **Waiting for disk space...**\n\n"
+                "Other downloads are using the temporary storage. Yours starts as soon as there is room."
+            )
+        return self.disk_budget.reserve(job['id'], self.job_workspace(job), expected, on_wait)
+
+    async def run_janitor(self):
+        """Reclaim orphaned temp files now and every JANITOR_INTERVAL seconds, until cancelled"""
+        while True:
+            try:
+                freed = await asyncio.get_event_loop().run_in_executor(None, clean_temp_dir, self.job_store)
+                if freed:
+                    logger.info(f"Temp janitor freed {freed/(1024*1024):.1f} MB")
+            except Exception as e:
+                logger.warning(f"Temp janitor failed: {e}")
+            await asyncio.sleep(Config.JANITOR_INTERVAL)
+
+    async def wait_for_quota(self, job: dict, units: int):
+        """Reserve quota on a pool credential, waiting for the daily reset if all are used up"""
+        pool = self.youtube_uploader.pool
+        notified = False
+        while True:
+            reservation = pool.acquire(units)
+            if reservation:
+                return reservation
+
+            if not notified:
+                reset = next_reset().astimezone()
+                logger.info(f"Deferring job {job['id']} until quota reset at {reset.isoformat()}")
+                await self.update_status(
+                    job,
+                    "⏳ **Daily YouTube Quota Used Up**\n\n"
+                    f"Your video will be processed automatically after the quota resets "
+                    f"({reset.strftime('%Y-%m-%d %H:%M %Z')})."
+                )
+                notified = True
+            # Wake up early now and then in case reservations were released
+            # or a failed credential came back
+            await asyncio.sleep(min(seconds_until_reset() + 1, 300))
+
+    async def process_video_file(self, job: dict):
+        """Process uploaded video file"""
+        if job['stage'] == 'queued':
+            message = job.get('message') or await self.app.get_messages(job['chat_id'], job['message_id'])
+            video = message.video or message.document if message and not message.empty else None
+            if not video:
+                await self.fail_job(job, "❌ **Video Unavailable**\n\nThe original message was deleted.", 'Message deleted')
+                return
+
+            # The same file may have been uploaded while this job was waiting
+            if await self.check_duplicate(job, file_key(video.file_unique_id)):
+                return
+
+            file_size = video.file_size
+            file_name = getattr(video, 'file_name', None) or f"video_{video.file_unique_id}"
+
+            # Check file size
+            if file_size > Config.MAX_FILE_SIZE:
+                await self.fail_job(
+                    job,
+                    f"❌ **File Too Large**\n\n"
+                    f"📁 **Size:** {file_size / (1024*1024):.1f} MB\n"
+                    f"📏 **Limit:** {Config.MAX_FILE_SIZE / (1024*1024):.1f} MB\n\n"
+                    "Please send a smaller file.",
+                    'File too large'
+                )
+                return
+
+            # Check duration for video files
+            if hasattr(video, 'duration') and video.duration:
+                if video.duration > Config.MAX_VIDEO_DURATION:
+                    await self.fail_job(
+                        job,
+                        f"❌ **Video Too Long**\n\n"
+                        f"⏱️ **Duration:** {video.duration // 60} minutes\n"
+                        f"⏰ **Limit:** {Config.MAX_VIDEO_DURATION // 60} minutes\n\n"
+                        "Please send a shorter video.",
+                        'Video too long'
+                    )
+                    return
+
+            # Prepare video metadata
+            video_title = Path(file_name).stem
+            if len(video_title) > 100:
+                video_title = video_title[:100]
+
+            video_info = {
+                'title': video_title,
+                'description': f"Uploaded via Telegram Bot on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\nOriginal filename: {file_name}\nFile size: {file_size / (1024*1024):.1f} MB\nUploaded by: @{job['username']}",
+                'tags': ['telegram', 'bot', 'upload', 'video'],
+                'category_id': '22',
+                'privacy_status': Config.YOUTUBE_PRIVACY_STATUS
+            }
+            self.job_store.update(job, file_name=file_name, file_size=file_size, video_info=video_info)
+
+            if Config.STREAM_UPLOADS:
+                await self.update_status(job, "⏫ **Streaming to YouTube...**\n\n*This may take a while for large files...*")
+
+                # Pipe Telegram media straight into the upload, no temp file
+                async with self.scheduler.stage('download'), self.scheduler.stage('upload'), \
+                        self.media_pool.acquire() as (client,):
+                    youtube_url = await self.stream_to_youtube(job, client.stream_media(message), file_size, video_info)
+
+                await self.complete_job(job, youtube_url)
+                return
+
+            await self.update_status(job, "⏬ **Downloading video...**")
+
+            # Create unique file path
+            file_extension = Path(file_name).suffix or '.mp4'
+            workspace = self.job_workspace(job)
+            workspace.mkdir(parents=True, exist_ok=True)
+            file_path = workspace / f"{job['id']}{file_extension}"
+
+            # Download video file
+            async with self.reserve_disk(job, file_size), self.scheduler.stage('download'), \
+                    self.progress.track(job, "⏬ **Downloading video...**") as progress:
+                sha256 = await self.download_media(message, file_path, file_size, progress)
+
+            self.job_store.update(job, stage='downloaded', file_path=str(file_path), bytes_done=file_size)
+
+            # Identical content sent as a different file
+            if await self.check_duplicate(job, hash_key(sha256)):
+                return
+
+        await self.upload_job(job)
+
+    async def process_video_url(self, job: dict):
+        """Process video URL"""
+        url = job['url']
+
+        if job['stage'] == 'queued':
+            if await self.check_duplicate(job, url_key(url)):
+                return
+
+            await self.update_status(job, "🔍 **Analyzing URL...**")
+
+            # Get video info first
+            async with self.scheduler.stage('analyze'):
+                info_result = await self.video_downloader.get_video_info(url)
+            if not info_result['success']:
+                await self.fail_job(job, f"❌ **URL Analysis Failed**\n\n**Error:** {info_result['error']}", info_result['error'])
+                return
+
+            video_info = info_result['info']
+
+            # Another link to a video we already uploaded
+            keys = [url_key(video_info['webpage_url'])]
+            if video_info.get('extractor') and video_info.get('id'):
+                keys.append(video_key(video_info['extractor'], video_info['id']))
+            if await self.check_duplicate(job, *keys):
+                return
+
+            # Check duration
+            if video_info['duration'] > Config.MAX_VIDEO_DURATION:
+                await self.fail_job(
+                    job,
+                    f"❌ **Video Too Long**\n\n"
+                    f"⏱️ **Duration:** {video_info['duration'] // 60} minutes\n"
+                    f"⏰ **Limit:** {Config.MAX_VIDEO_DURATION // 60} minutes\n\n"
+                    f"**Video:** {video_info['title']}",
+                    'Video too long'
+                )
+                return
+
+            await self.update_status(
+                job,
+                f"📹 **Video Found**\n\n"
+                f"**Title:** {video_info['title'][:50]}...\n"
+                f"**Duration:** {video_info['duration'] // 60}:{video_info['duration'] % 60:02d}\n"
+                f"**Uploader:** {video_info['uploader']}\n"
+                f"**Views:** {video_info['view_count']:,}\n\n"
+                "⏬ **Starting download...**"
+            )
+            # Merging keeps the separate streams on disk next to the merged file
+            expected = video_info.get('filesize') or 0
+            if video_info.get('needs_merge'):
+                expected *= 2
+            self.job_store.update(job, stage='analyzed', file_size=expected)
+
+        if job['stage'] == 'analyzed':
+            # Stream single-file formats straight into the upload when enabled
+            expected = job.get('file_size') or Config.DISK_DEFAULT_RESERVATION
+            async with self.reserve_disk(job, expected), self.scheduler.stage('download'):
+                download_result = None
+                if Config.STREAM_UPLOADS:
+                    download_result = await self.video_downloader.open_stream(url, self.job_workspace(job))
+                    if download_result.get('fallback'):
+                        download_result = None
+
+                # Download video from URL
+                if download_result is None:
+                    async with self.progress.track(job, "⏬ **Downloading video...**") as progress:
+                        download_result = await self.video_downloader.download_video(
+                            url, self.job_workspace(job), progress_callback=progress
+                        )
+
+            if not download_result['success']:
+                await self.fail_job(
+                    job,
+                    f"❌ **Download Failed**\n\n"
+                    f"**Error:** {download_result['error']}\n"
+                    f"**URL:** {url}\n\n"
+                    "**Common causes:**\n"
+                    "• Video is private or removed\n"
+                    "• Geographic restrictions\n"
+                    "• Platform blocking downloads",
+                    download_result['error']
+                )
+                return
+
+            video_info = download_result['info']
+
+            # Prepare video metadata
+            video_title = video_info.get('title', 'Downloaded Video')
+            if len(video_title) > 100:
+                video_title = video_title[:100]
+
+            upload_info = {
+                'title': video_title,
+                'description': f"Downloaded from: {url}\n\nOriginal uploader: {video_info.get('uploader', 'Unknown')}\nOriginal views: {video_info.get('view_count', 0):,}\nUploaded via Telegram Bot on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\nBot user: @{job['username']}\n\n{video_info.get('description', '')[:4000]}",
+                'tags': (video_info.get('tags', []) + ['telegram', 'bot', 'download'])[:30],
+                'category_id': '22',
+                'privacy_status': Config.YOUTUBE_PRIVACY_STATUS
+            }
+
+            if 'stream' in download_result:
+                self.job_store.update(job, video_info=upload_info)
+                await self.update_status(job, "⏫ **Streaming to YouTube...**\n\n*This may take a while...*")
+
+                async with self.scheduler.stage('download'), self.scheduler.stage('upload'):
+                    youtube_url = await self.stream_to_youtube(
+                        job, download_result['stream'], download_result['filesize'], upload_info
+                    )
+
+                await self.complete_job(job, youtube_url)
+                return
+
+            self.job_store.update(
+                job,
+                stage='downloaded',
+                file_path=download_result['file_path'],
+                file_size=video_info['filesize'],
+                bytes_done=video_info['filesize'],
+                video_info=upload_info
+            )
+
+        await self.upload_job(job)
+
+    async def upload_job(self, job: dict):
+        """Upload a downloaded job's file, resuming its upload session if one was stored"""
+        await self.update_status(job, "⏫ **Uploading to YouTube...**\n\n*This may take a while for large files...*")
+
+        async with self.scheduler.stage('upload'), \
+                self.progress.track(job, "⏫ **Uploading to YouTube...**") as progress:
+            def on_progress(uploaded, total):
+                self.job_store.update(job, bytes_done=uploaded)
+                progress(uploaded, total)
+
+            youtube_url = await self.youtube_uploader.upload_video(
+                job['file_path'], job['video_info'],
+                session_key=job['id'],
+                progress_callback=on_progress,
+                reservation=job.get('reservation')
+            )
+
+        await self.complete_job(job, youtube_url)
+
+    async def complete_job(self, job: dict, youtube_url: str):
+        """Record the upload result and report it to the user"""
+        if not youtube_url:
+            await self.fail_job(
+                job,
+                "❌ **Upload Failed**\n\n"
+                "The video could not be uploaded to YouTube.\n"
+                "Possible reasons:\n"
+                "• Authentication expired\n"
+                "• File format not supported by YouTube\n"
+                "• Network connectivity issues\n"
+                "• YouTube API quota exceeded\n\n"
+                "Please try again later.",
+                'Upload failed'
+            )
+            return
+
+        self.job_store.update(job, stage='done', youtube_url=youtube_url)
+        self.upload_ledger.record(youtube_url, *(job.get('content_keys') or []))
+
+        if job['kind'] == 'file':
+            source = (
+                f"📁 **File:** {job['file_name']}\n"
+                f"💾 **Size:** {job['file_size'] / (1024*1024):.1f} MB\n"
+            )
+        else:
+            source = (
+                f"🔗 **Source:** {job['url']}\n"
+                f"📝 **Title:** {job['video_info']['title']}\n"
+            )
+
+        auth_method = await self.youtube_uploader.get_auth_method()
+        await self.update_status(
+            job,
+            f"✅ **Upload Successful!**\n\n"
+            f"🎥 **YouTube URL:** {youtube_url}\n"
+            f"{source}"
+            f"🔐 **Auth:** {auth_method}\n"
+            f"🔒 **Privacy:** {Config.YOUTUBE_PRIVACY_STATUS}\n"
+            f"📅 **Uploaded:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+            "🎉 Your video is now live on YouTube!"
+        )
+
+    @staticmethod
+    def duplicate_text(youtube_url: str) -> str:
+        """Message for a video that is already on YouTube"""
+        return (
+            "♻️ **Already Uploaded**\n\n"
+            f"🎥 **YouTube URL:** {youtube_url}\n\n"
+            "This video was uploaded before, so it was not uploaded again."
+        )
+
+    async def check_duplicate(self, job: dict, *keys) -> bool:
+        """Add content keys to a job and finish it right away if the ledger knows the video"""
+        keys = sorted(set(job.get('content_keys') or []) | set(keys))
+        self.job_store.update(job, content_keys=keys)
+
+        youtube_url = self.upload_ledger.lookup(*keys)
+        if not youtube_url:
+            return False
+
+        logger.info(f"Job {job['id']} is a duplicate of {youtube_url}")
+        self.upload_ledger.record(youtube_url, *keys)
+        self.job_store.update(job, stage='done', youtube_url=youtube_url)
+        await self.update_status(job, self.duplicate_text(youtube_url))
+        return True
+
+    async def download_media(self, message, file_path: Path, file_size: int, progress_callback=None) -> str:
+        """Download Telegram media to a file over parallel part streams; returns its SHA-256"""
+        async with self.media_pool.acquire(Config.TELEGRAM_DOWNLOAD_CONNECTIONS) as clients:
+            # One part stream per transfer slot the pool could spare
+            download = TelegramDownload(clients, message, file_path, file_size,
+                                        connections=len(clients), progress_callback=progress_callback)
+            return await download.run()
+
+    async def fail_job(self, job: dict, text: str, error: str):
+        """Mark a job as failed and tell the user why"""
+        self.job_store.update(job, stage='failed', error=error)
+        await self.update_status(job, text)
+
+    async def update_status(self, job: dict, text: str):
+        """Show job progress in its status message, creating it on first use"""
+        if job.get('status_message_id'):
+            await self.outbox.edit_message(job['chat_id'], job['status_message_id'], text)
+        else:
+            status_msg = await self.outbox.send(job['chat_id'], text, reply_to_message_id=job['message_id'])
+            self.job_store.update(job, status_message_id=status_msg.id)
+
+    async def stream_to_youtube(self, job: dict, chunks, file_size: int, video_info: dict) -> str:
+        """Upload chunks from an async iterator while they are still arriving"""
+        buffer = StreamBuffer(Config.STREAM_BUFFER_CHUNKS)
+        producer = asyncio.create_task(buffer.feed(chunks))
+        try:
+            async with self.progress.track(job, "⏫ **Streaming to YouTube...**") as progress:
+                youtube_url = await self.youtube_uploader.upload_stream(
+                    buffer, file_size, video_info, job.get('reservation'), progress_callback=progress
+                )
+        finally:
+            producer.cancel()
+
+        if youtube_url:
+            keys = set(job.get('content_keys') or [])
+            keys.add(hash_key(buffer.sha256.hexdigest()))
+            self.job_store.update(job, content_keys=sorted(keys))
+        return youtube_url
+
+    def cleanup_temp_file(self, file_path):
+        """Delete a temp file"""
+        file_path = Path(file_path)
+        if file_path.exists():
+            try:
+                file_path.unlink()
+            except:
+                pass
@@ -0,0 +1,107 @@
+import time
+import asyncio
+import logging
+
+from .config import Config
+from .outbox import TokenBuckets
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+BAR_WIDTH = 10
+
+class ProgressTracker:
+    """Live progress of one job stage, shown in the job's status message.
+
+    Calling the tracker with (done, total) only records the latest state.
+    One pending flush edits the message at most every PROGRESS_UPDATE_INTERVAL
+    seconds and within the chat's edit budget, showing whatever state is
+    the latest by then, so intermediate states are dropped.
+    """
+
+    def __init__(self, reporter, job: dict, title: str):
+        self.reporter = reporter
+        self.job = job
+        self.title = title
+        self._latest = None
+        self._flush_task = None
+        self._last_edit = time.monotonic()
+        self._sample = None
+        self._speed = None
+        self.closed = False
+
+    def __call__(self, done: int, total: int):
+        # Callbacks from executor threads can still arrive after the stage ended
+        if self.closed:
+            return
+        self._latest = (done, total)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # A late progress edit must not overwrite the status that follows the stage
+        self.closed = True
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+
+    async def _flush(self):
+        delay = self._last_edit + self.reporter.interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        # Progress only spends its own share of the chat's edits, leaving room for real replies
+        chat_id = self.job['chat_id']
+        await self.reporter.budget.acquire(chat_id)
+
+        try:
+            await self.reporter.edit(self.job, self.render(*self._latest))
+        except Exception as e:
+            logger.debug(f"Progress edit for job {self.job['id']} failed: {e}")
+        self._last_edit = time.monotonic()
+
+    def render(self, done: int, total: int) -> str:
+        """Format progress with percentage, throughput and ETA"""
+        now = time.monotonic()
+        if self._sample:
+            elapsed = now - self._sample[0]
+            if elapsed > 0:
+                speed = max(0, done - self._sample[1]) / elapsed
+                # Smooth out bursty chunk arrival
+                self._speed = speed if self._speed is None else 0.3 * speed + 0.7 * self._speed
+        self._sample = (now, done)
+
+        lines = [self.title, '']
+        if total:
+            fraction = min(1, done / total)
+            filled = int(fraction * BAR_WIDTH)
+            lines.append(f"{'█' * filled}{'░' * (BAR_WIDTH - filled)} {fraction * 100:.0f}%")
+            lines.append(f"📦 **Done:** {done / MB:.1f} / {total / MB:.1f} MB")
+        else:
+            lines.append(f"📦 **Done:** {done / MB:.1f} MB")
+
+        if self._speed:
+            lines.append(f"⚡ **Speed:** {self._speed / MB:.1f} MB/s")
+            if total and done < total:
+                eta = int((total - done) / self._speed)
+                lines.append(f"⏱️ **ETA:** {eta // 60}:{eta % 60:02d}")
+        return '\n'.join(lines)
+
+
+class ProgressReporter:
+    """Hands out progress trackers that share one per-chat edit budget"""
+
+    def __init__(self, edit, interval: float = None, edits_per_minute: int = None):
+        self.edit = edit
+        self.interval = Config.PROGRESS_UPDATE_INTERVAL if interval is None else interval
+        self.budget = TokenBuckets((edits_per_minute or Config.PROGRESS_CHAT_EDITS_PER_MINUTE) / 60, 3)
+
+    def track(self, job: dict, title: str) -> ProgressTracker:
+        """Get a tracker to use with `async with` for the duration of a stage"""
+        return ProgressTracker(self, job, title)
@@ -0,0 +1,161 @@
+import os
+import json
+import uuid
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta, timezone
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Google resets the YouTube Data API quota at midnight Pacific time
+QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+
+# Units charged per call, from the YouTube Data API quota table
+API_COSTS = {
+    'videos.insert': 1600,
+    'channels.list': 1,
+}
+
+def next_reset() -> datetime:
+    """Get the next Pacific midnight, when every project's quota resets"""
+    tomorrow = datetime.now(QUOTA_TIMEZONE).date() + timedelta(days=1)
+    return datetime.combine(tomorrow, time.min, tzinfo=QUOTA_TIMEZONE)
+
+def seconds_until_reset() -> float:
+    """Get the seconds until the quota resets"""
+    reset = next_reset().astimezone(timezone.utc)
+    return max(0.0, (reset - datetime.now(timezone.utc)).total_seconds())
+
+class QuotaLedger:
+    """Track the YouTube Data API quota units one project spent today.
+
+    Usage and reservations are kept in a JSON file on the state volume so
+    they survive restarts and are shared by every process: each
+    read-modify-write holds an flock on a lock file next to it, so
+    admission is decided against the reservations of all workers. A
+    reservation is a lease its holder renews with renew(); one whose
+    holder died stops counting after QUOTA_RESERVATION_LEASE seconds.
+    """
+
+    def __init__(self, path: Path, daily_limit: int = None):
+        self.path = Path(path)
+        self.daily_limit = daily_limit if daily_limit is not None else Config.YOUTUBE_DAILY_QUOTA
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        """Hold the ledger against other threads and other processes"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.path.with_suffix('.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _today(self) -> str:
+        return datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+    @staticmethod
+    def _now() -> float:
+        return datetime.now(timezone.utc).timestamp()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        reservations = state.get('reservations', {})
+        if state.get('day') != self._today():
+            # Held reservations carry over into the new day, usage does not
+            state = {'day': self._today(), 'used': 0, 'calls': {}}
+        now = self._now()
+        state['reservations'] = {
+            key: entry for key, entry in reservations.items() if entry['expires'] > now
+        }
+        return state
+
+    def _save(self, state: dict):
+        tmp_path = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _reserved(state: dict) -> int:
+        return sum(entry['units'] for entry in state['reservations'].values())
+
+    def record(self, method: str, units: int = None):
+        """Charge an API call to today's usage"""
+        self.commit(method, None, units)
+
+    def commit(self, method: str, key: str, units: int = None):
+        """Charge an API call paid for with the reservation `key` from reserve(), if any"""
+        if units is None:
+            units = API_COSTS.get(method, 1)
+        with self._locked():
+            state = self._load()
+            state['used'] += units
+            state['calls'][method] = state['calls'].get(method, 0) + 1
+            if key:
+                state['reservations'].pop(key, None)
+            self._save(state)
+        logger.debug(f"Quota {self.path.stem}: {method} cost {units} units, {state['used']}/{self.daily_limit} used today")
+
+    def exhaust(self):
+        """Mark today's quota as used up, e.g. after a quotaExceeded error"""
+        with self._locked():
+            state = self._load()
+            state['used'] = max(state['used'], self.daily_limit)
+            self._save(state)
+        logger.warning(f"YouTube API quota for {self.path.stem} exhausted until {next_reset().isoformat()}")
+
+    def used(self) -> int:
+        """Get the units spent today"""
+        with self._locked():
+            return self._load()['used']
+
+    def reserved(self) -> int:
+        """Get the units held by live reservations of every process"""
+        with self._locked():
+            return self._reserved(self._load())
+
+    def remaining(self) -> int:
+        """Get the units left today after outstanding reservations"""
+        with self._locked():
+            state = self._load()
+            return max(0, self.daily_limit - state['used'] - self._reserved(state))
+
+    def reserve(self, units: int) -> str:
+        """Set aside units for an admitted job if today's budget allows it; returns the reservation key or None"""
+        with self._locked():
+            state = self._load()
+            if self.daily_limit - state['used'] - self._reserved(state) < units:
+                return None
+            key = uuid.uuid4().hex
+            state['reservations'][key] = {'units': units, 'expires': self._now() + Config.QUOTA_RESERVATION_LEASE}
+            self._save(state)
+            return key
+
+    def renew(self, key: str):
+        """Extend the lease of a reservation that is still held"""
+        with self._locked():
+            state = self._load()
+            entry = state['reservations'].get(key)
+            if entry:
+                entry['expires'] = self._now() + Config.QUOTA_RESERVATION_LEASE
+                self._save(state)
+
+    def release(self, key: str):
+        """Return units reserved by reserve()"""
+        with self._locked():
+            state = self._load()
+            if state['reservations'].pop(key, None):
+                self._save(state)
@@ -0,0 +1,325 @@
+import asyncio
+import json
+import logging
+import queue
+import re
+from contextlib import contextmanager
+from pathlib import Path
+
+import aiohttp
+import httplib2
+from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.http import build_http
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_URL = 'https://www.googleapis.com/upload/youtube/v3/videos'
+
+# Every chunk except the last must be a multiple of 256 KiB
+CHUNK_GRANULARITY = 256 * 1024
+
+RETRYABLE_STATUSES = (500, 502, 503, 504)
+SESSION_EXPIRED_STATUSES = (404, 410)
+RETRYABLE_EXCEPTIONS = (OSError, httplib2.HttpLib2Error, aiohttp.ClientError)
+MAX_BACKOFF = 64
+
+
+class ResumableUploadError(Exception):
+    """Raised when the upload session answers with an unexpected status"""
+
+    def __init__(self, status, content=b''):
+        self.status = status
+        self.content = content
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', errors='replace')
+        super().__init__(f"HTTP {status}: {content[:500]}")
+
+
+class UploadNotResumableError(ResumableUploadError):
+    """Raised when the session of a stream is lost after bytes that cannot be sent again"""
+
+    def __init__(self, status, offset: int):
+        self.status = status
+        self.content = b''
+        Exception.__init__(self, f"Upload session lost (HTTP {status}) after {offset} bytes "
+                                 f"of a stream that cannot be rewound, the upload has to start over")
+
+
+class AuthorizedHttpPool:
+    """Thread-safe pool of authorized httplib2 clients for one credential.
+
+    httplib2.Http is not thread-safe, so every request checks out a client
+    of its own. Returned clients keep their keep-alive connections open
+    for the next request.
+    """
+
+    def __init__(self, credentials, max_idle: int = 10):
+        self.credentials = credentials
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    @contextmanager
+    def client(self):
+        """Check out a client for the duration of one request"""
+        try:
+            http = self._idle.get_nowait()
+        except queue.Empty:
+            # build_http() keeps httplib2 from following the protocol's 308 as a redirect
+            http = AuthorizedHttp(self.credentials, http=build_http())
+
+        try:
+            yield http
+        finally:
+            try:
+                self._idle.put_nowait(http)
+            except queue.Full:
+                pass
+
+
+class Httplib2Transport:
+    """Runs requests on pooled blocking httplib2 clients in the default executor"""
+
+    def __init__(self, pool: AuthorizedHttpPool):
+        self.pool = pool
+
+    async def request(self, uri: str, method: str, body=None, headers=None):
+        def _request():
+            with self.pool.client() as http:
+                return http.request(uri, method=method, body=body, headers=headers)
+
+        resp, content = await asyncio.get_event_loop().run_in_executor(None, _request)
+        return resp.status, dict(resp), content
+
+
+class AiohttpTransport:
+    """Runs requests on a shared aiohttp session with keep-alive connections.
+
+    The access token is added to each request and refreshed in the
+    executor only when it has expired or the server answered 401.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, credentials):
+        self.session = session
+        self.credentials = credentials
+
+    async def _refresh(self):
+        await asyncio.get_event_loop().run_in_executor(None, self.credentials.refresh, Request())
+
+    async def request(self, uri: str, method: str, body=None, headers=None):
+        if not self.credentials.valid:
+            await self._refresh()
+
+        for attempt in range(2):
+            request_headers = dict(headers or {})
+            self.credentials.apply(request_headers)
+            # 308 is part of the upload protocol, never follow it
+            async with self.session.request(method, uri, data=body, headers=request_headers,
+                                            allow_redirects=False) as resp:
+                content = await resp.read()
+                if resp.status == 401 and attempt == 0:
+                    await self._refresh()
+                    continue
+                return resp.status, {k.lower(): v for k, v in resp.headers.items()}, content
+
+
+class FileMedia:
+    """Seekable media source backed by a file on disk"""
+
+    seekable = True
+
+    def __init__(self, file_path, mimetype: str = 'video/*'):
+        self.path = Path(file_path)
+        self.size = self.path.stat().st_size
+        self.mimetype = mimetype
+
+    async def read(self, offset: int, length: int):
+        """Return (data, is_last) for the chunk starting at offset"""
+        def _read():
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                return f.read(length)
+
+        data = await asyncio.get_event_loop().run_in_executor(None, _read)
+        return data, offset + len(data) >= self.size
+
+
+class StreamMedia:
+    """Non-seekable media source fed from a StreamBuffer.
+
+    Bytes from the last acknowledged offset onwards are kept in memory so a
+    chunk can be re-sent after an error, but the stream cannot be rewound
+    any further than that.
+    """
+
+    seekable = False
+
+    def __init__(self, buffer, size: int = None, mimetype: str = 'video/*'):
+        self.buffer = buffer
+        self.size = size
+        self.mimetype = mimetype
+        self._data = bytearray()
+        self._start = 0
+        self._eof = False
+
+    async def read(self, offset: int, length: int):
+        """Return (data, is_last) for the chunk starting at offset"""
+        if offset < self._start:
+            raise ValueError(f"Stream cannot be rewound to byte {offset}")
+
+        del self._data[:offset - self._start]
+        self._start = offset
+
+        # Read one byte past the chunk to learn whether it is the last one
+        while not self._eof and len(self._data) <= length:
+            chunk = await self.buffer.read_chunk()
+            if chunk:
+                self._data.extend(chunk)
+            else:
+                self._eof = True
+
+        return bytes(self._data[:length]), self._eof and len(self._data) <= length
+
+
+class ResumableUpload:
+    """Chunked client for the YouTube resumable upload protocol.
+
+    The upload is sent in chunks of ``chunk_size`` bytes. After a 5xx or a
+    dropped connection the session is asked how many bytes it has received
+    and the upload continues from that offset instead of starting over.
+    """
+
+    def __init__(self, transport, media, body: dict, chunk_size: int,
+                 max_retries: int = 5, upload_uri: str = None, progress_callback=None,
+                 session_callback=None):
+        self.transport = transport
+        self.media = media
+        self.body = body
+        self.chunk_size = max(CHUNK_GRANULARITY, chunk_size // CHUNK_GRANULARITY * CHUNK_GRANULARITY)
+        self.max_retries = max_retries
+        self.upload_uri = upload_uri
+        self.progress_callback = progress_callback
+        self.session_callback = session_callback
+        self.offset = 0
+        self._logged_progress = -1
+        # A known upload URI must be synced with the server before sending data
+        self._in_error_state = upload_uri is not None
+
+    async def start(self):
+        """Open a new upload session and store its URI"""
+        headers = {
+            'Content-Type': 'application/json; charset=UTF-8',
+            'X-Upload-Content-Type': self.media.mimetype,
+        }
+        if self.media.size is not None:
+            headers['X-Upload-Content-Length'] = str(self.media.size)
+
+        uri = f"{UPLOAD_URL}?uploadType=resumable&part={','.join(self.body.keys())}"
+        status, headers, content = await self.transport.request(
+            uri, 'POST', body=json.dumps(self.body), headers=headers
+        )
+        if status != 200 or 'location' not in headers:
+            raise ResumableUploadError(status, content)
+
+        self.upload_uri = headers['location']
+        self.offset = 0
+        self._in_error_state = False
+        logger.info("Resumable upload session created")
+        if self.session_callback:
+            self.session_callback(self.upload_uri)
+        return self.upload_uri
+
+    async def query_progress(self):
+        """Ask the session how many bytes arrived; returns the response if already complete"""
+        total = self.media.size if self.media.size is not None else '*'
+        status, headers, content = await self.transport.request(
+            self.upload_uri, 'PUT', body=b'',
+            headers={'Content-Range': f'bytes */{total}', 'Content-Length': '0'}
+        )
+        response = self._process_response(status, headers, content)
+        self._in_error_state = False
+        logger.info(f"Upload session has {self.offset} bytes, resuming from there")
+        return response
+
+    async def next_chunk(self):
+        """Send one chunk; returns the video resource once the upload is complete"""
+        data, is_last = await self.media.read(self.offset, self.chunk_size)
+
+        if data:
+            end = self.offset + len(data) - 1
+            total = end + 1 if is_last else (self.media.size if self.media.size is not None else '*')
+            content_range = f'bytes {self.offset}-{end}/{total}'
+        else:
+            # Stream ended exactly on a chunk boundary, finalize the length
+            content_range = f'bytes */{self.offset}'
+
+        status, headers, content = await self.transport.request(
+            self.upload_uri, 'PUT', body=data,
+            headers={'Content-Range': content_range, 'Content-Length': str(len(data))}
+        )
+        return self._process_response(status, headers, content)
+
+    def _process_response(self, status, headers, content):
+        if status in (200, 201):
+            self.offset = self.media.size if self.media.size is not None else self.offset
+            return json.loads(content)
+
+        if status == 308:
+            match = re.match(r'bytes=0-(\d+)', headers.get('range', ''))
+            self.offset = int(match.group(1)) + 1 if match else 0
+            self._log_progress()
+            if self.progress_callback:
+                self.progress_callback(self.offset, self.media.size)
+            return None
+
+        raise ResumableUploadError(status, content)
+
+    def _log_progress(self):
+        """Log upload progress every 10%"""
+        if not self.media.size:
+            return
+        progress = int(self.offset * 100 / self.media.size)
+        if progress // 10 != self._logged_progress:
+            self._logged_progress = progress // 10
+            logger.info(f"Upload progress: {progress}%")
+
+    async def execute(self) -> dict:
+        """Upload the whole media, resuming from the last acknowledged byte on errors"""
+        retries = 0
+        while True:
+            try:
+                if self.upload_uri is None:
+                    await self.start()
+                elif self._in_error_state:
+                    response = await self.query_progress()
+                    if response is not None:
+                        return response
+
+                response = await self.next_chunk()
+                if response is not None:
+                    return response
+                retries = 0
+                continue
+
+            except ResumableUploadError as e:
+                if e.status in SESSION_EXPIRED_STATUSES and self.upload_uri:
+                    if self.offset and not self.media.seekable:
+                        raise UploadNotResumableError(e.status, self.offset) from e
+                    logger.warning("Upload session expired, starting a new one")
+                    self.upload_uri = None
+                    self.offset = 0
+                elif e.status not in RETRYABLE_STATUSES:
+                    raise
+                last_error = e
+            except RETRYABLE_EXCEPTIONS as e:
+                last_error = e
+
+            retries += 1
+            if retries > self.max_retries:
+                logger.error(f"Upload failed after {self.max_retries} retries: {last_error}")
+                raise last_error
+
+            self._in_error_state = self.upload_uri is not None
+            wait_time = min(2 ** retries, MAX_BACKOFF)
+            logger.warning(f"Upload interrupted at byte {self.offset}: {last_error}")
+            logger.info(f"Retrying in {wait_time} seconds...")
+            await asyncio.sleep(wait_time)
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from collections import deque
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+class JobScheduler:
+    """Per-user FIFO job queues with a concurrency limit for each pipeline stage.
+
+    Each user's jobs run one after another in the order they were sent,
+    while the analyze, download and upload stages of all users share
+    global worker slots.
+    """
+
+    STAGES = ('analyze', 'download', 'upload')
+
+    def __init__(self, handler, stage_limits: dict = None):
+        self.handler = handler
+        self.stage_limits = stage_limits or {
+            'analyze': Config.MAX_CONCURRENT_ANALYSES,
+            'download': Config.MAX_CONCURRENT_DOWNLOADS,
+            'upload': Config.MAX_CONCURRENT_UPLOADS,
+        }
+        self._semaphores = {
+            stage: asyncio.Semaphore(self.stage_limits[stage]) for stage in self.STAGES
+        }
+        self._queues = {}
+        self._runners = {}
+        self._running = {}
+
+    def submit(self, job: dict) -> int:
+        """Queue a job for its user; returns the number of that user's jobs ahead of it"""
+        user_id = job['user_id']
+        queue = self._queues.setdefault(user_id, deque())
+        queue.append(job)
+
+        ahead = len(queue) - 1 + (1 if user_id in self._running else 0)
+        if user_id not in self._runners:
+            self._runners[user_id] = asyncio.create_task(self._run_user(user_id))
+        return ahead
+
+    def pending(self, user_id: int) -> int:
+        """Get the number of queued and running jobs for a user"""
+        return len(self._queues.get(user_id, ())) + (1 if user_id in self._running else 0)
+
+    def stage(self, name: str) -> asyncio.Semaphore:
+        """Get the worker slot for a stage, to be held with `async with`"""
+        return self._semaphores[name]
+
+    async def _run_user(self, user_id: int):
+        """Run a user's jobs one at a time until their queue is empty"""
+        queue = self._queues[user_id]
+        try:
+            while queue:
+                job = queue.popleft()
+                self._running[user_id] = job
+                try:
+                    await self.handler(job)
+                except Exception as e:
+                    logger.error(f"Job {job.get('id')} failed: {e}")
+                finally:
+                    self._running.pop(user_id, None)
+        finally:
+            self._runners.pop(user_id, None)
+            if not queue:
+                self._queues.pop(user_id, None)
@@ -0,0 +1,43 @@
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+class StreamBuffer:
+    """Bounded async buffer between a chunk producer and the uploader.
+
+    The producer blocks once ``max_chunks`` chunks are waiting, so memory
+    stays bounded and a fast download is paced by the upload.
+    """
+
+    def __init__(self, max_chunks: int):
+        self._queue = asyncio.Queue(maxsize=max_chunks)
+        self.bytes_fed = 0
+        # Content hash for the upload ledger, computed as the bytes pass through
+        self.sha256 = hashlib.sha256()
+
+    async def feed(self, chunks):
+        """Copy chunks from an async iterator into the buffer until it ends"""
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    self.bytes_fed += len(chunk)
+                    self.sha256.update(chunk)
+                    await self._queue.put(chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Stream producer failed after {self.bytes_fed} bytes: {e}")
+            await self._queue.put(e)
+        else:
+            await self._queue.put(None)
+
+    async def read_chunk(self) -> bytes:
+        """Get the next chunk, or b'' once the producer has finished"""
+        item = await self._queue.get()
+        if item is None:
+            return b''
+        if isinstance(item, Exception):
+            raise item
+        return item
@@ -0,0 +1,144 @@
+import os
+import math
+import asyncio
+import hashlib
+import logging
+from pathlib import Path
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# pyrogram streams media in chunks of 1 MiB; offsets and limits count chunks
+CHUNK_SIZE = 1024 * 1024
+RANGE_RETRIES = 3
+
+class TelegramDownload:
+    """Downloads one Telegram file over several concurrent range streams.
+
+    The file is split into one contiguous range per connection, up to
+    TELEGRAM_DOWNLOAD_CONNECTIONS, and each range is fetched with a single
+    stream_media call written at its offset into a preallocated file.
+    pyrogram opens a media session (and on another DC exports the
+    authorization) for every stream, so there are only as many as there
+    are connections. Memory stays at about one chunk per connection. The
+    SHA-256 is still computed in file order, following the range that
+    holds the first unhashed byte as it is written.
+    """
+
+    def __init__(self, clients: list, message, file_path: Path, file_size: int,
+                 connections: int = None, progress_callback=None):
+        self.clients = clients
+        self.message = message
+        self.file_path = Path(file_path)
+        self.file_size = file_size
+        chunks = max(1, math.ceil(file_size / CHUNK_SIZE))
+        connections = max(1, min(connections or Config.TELEGRAM_DOWNLOAD_CONNECTIONS, chunks))
+        bounds = [index * chunks // connections for index in range(connections + 1)]
+        # (first chunk, end chunk) of each range
+        self.ranges = list(zip(bounds, bounds[1:]))
+        self.progress_callback = progress_callback
+        self.downloaded = 0
+        self.sha256 = hashlib.sha256()
+        # Bytes written so far from the start of each range
+        self._positions = [first * CHUNK_SIZE for first, _ in self.ranges]
+        self._hashed = 0
+        self._hash_lock = asyncio.Lock()
+
+    async def run(self) -> str:
+        """Download the whole file; returns its SHA-256 hex digest"""
+        loop = asyncio.get_event_loop()
+        fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            await loop.run_in_executor(None, self._preallocate, fd)
+
+            workers = [
+                asyncio.create_task(self._download_range(fd, self.clients[index % len(self.clients)], index))
+                for index in range(len(self.ranges))
+            ]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+            await self._advance_hash(fd)
+        finally:
+            os.close(fd)
+
+        return self.sha256.hexdigest()
+
+    def _preallocate(self, fd: int):
+        """Reserve the file's blocks up front so ranges can land anywhere in it"""
+        try:
+            os.posix_fallocate(fd, 0, self.file_size)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, self.file_size)
+
+    def _range_end(self, index: int) -> int:
+        return min(self.ranges[index][1] * CHUNK_SIZE, self.file_size)
+
+    async def _download_range(self, fd: int, client, index: int):
+        """Stream one range into its place in the file, resuming after its last chunk on errors"""
+        loop = asyncio.get_event_loop()
+        first, last = self.ranges[index]
+        end = self._range_end(index)
+
+        attempt = 0
+        while True:
+            # Resume at a chunk boundary, stream_media cannot start mid-chunk
+            resume = self._positions[index] // CHUNK_SIZE
+            self._report(resume * CHUNK_SIZE - self._positions[index])
+            self._positions[index] = position = resume * CHUNK_SIZE
+            try:
+                async for chunk in client.stream_media(self.message, limit=last - resume,
+                                                       offset=resume):
+                    await loop.run_in_executor(None, os.pwrite, fd, chunk, position)
+                    position += len(chunk)
+                    self._positions[index] = position
+                    self._report(len(chunk))
+                    if self._hashed >= first * CHUNK_SIZE:
+                        await self._advance_hash(fd)
+
+                if position != end:
+                    raise IOError(f"range ended after {position - first * CHUNK_SIZE} "
+                                  f"of {end - first * CHUNK_SIZE} bytes")
+                return
+            except Exception as e:
+                # Only failures in a row count, a stream that made progress starts over
+                attempt = attempt + 1 if position == resume * CHUNK_SIZE else 1
+                if attempt == RANGE_RETRIES:
+                    raise
+                logger.warning(f"Resuming range {index + 1}/{len(self.ranges)} of {self.file_path.name} "
+                               f"at {position} bytes: {e}")
+                await asyncio.sleep(attempt)
+
+    def _report(self, delta: int):
+        if not delta:
+            return
+        self.downloaded += delta
+        if self.progress_callback:
+            self.progress_callback(self.downloaded, self.file_size)
+
+    async def _advance_hash(self, fd: int):
+        """Hash the written bytes that directly follow the already hashed ones"""
+        loop = asyncio.get_event_loop()
+        async with self._hash_lock:
+            for index in range(len(self.ranges)):
+                end = self._range_end(index)
+                if self._hashed >= end:
+                    continue
+                written = self._positions[index]
+                if written > self._hashed:
+                    await loop.run_in_executor(None, self._hash_range, fd, self._hashed, written - self._hashed)
+                    self._hashed = written
+                if written < end:
+                    break
+
+    def _hash_range(self, fd: int, start: int, length: int):
+        end = start + length
+        while start < end:
+            data = os.pread(fd, min(CHUNK_SIZE, end - start), start)
+            if not data:
+                raise IOError(f"{self.file_path.name} is shorter than expected")
+            self.sha256.update(data)
+            start += len(data)
@@ -0,0 +1,95 @@
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = ('si', 'feature', 'fbclid', 'gclid', 'igshid', 'ref', 'ref_src', 'pp')
+
+def canonical_url(url: str) -> str:
+    """Normalize a video URL so different spellings of the same link match"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    for prefix in ('www.', 'm.', 'mobile.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = parts.path.rstrip('/') or '/'
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query)
+        if key not in TRACKING_PARAMS and not key.startswith('utm_')
+    ]
+
+    # youtu.be/ID and /shorts/ID are the same video as /watch?v=ID
+    if host == 'youtu.be':
+        host, query, path = 'youtube.com', [('v', path.lstrip('/'))] + query, '/watch'
+    elif host == 'youtube.com' and path.startswith('/shorts/'):
+        query, path = [('v', path[len('/shorts/'):])] + query, '/watch'
+    if host == 'youtube.com' and path == '/watch':
+        query = [(key, value) for key, value in query if key == 'v']
+
+    return urlunsplit(('https', host, path, urlencode(sorted(query)), ''))
+
+def file_key(file_unique_id: str) -> str:
+    return f"file:{file_unique_id}"
+
+def url_key(url: str) -> str:
+    return f"url:{canonical_url(url)}"
+
+def video_key(extractor: str, video_id: str) -> str:
+    return f"video:{extractor.lower()}:{video_id}"
+
+def hash_key(sha256: str) -> str:
+    return f"sha256:{sha256}"
+
+
+class UploadLedger:
+    """Persistent index of content we already uploaded.
+
+    Maps Telegram file_unique_ids, canonical URLs, extractor video IDs and
+    SHA-256 content hashes to the YouTube video they were uploaded as, so a
+    repeated video is answered without downloading or uploading it again.
+    """
+
+    def __init__(self, db_path: Path = None):
+        self.db_path = Path(db_path or Config.UPLOAD_LEDGER_FILE)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA busy_timeout=5000')
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS uploads (
+                key TEXT PRIMARY KEY,
+                youtube_url TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        """)
+
+    def lookup(self, *keys) -> str:
+        """Get the YouTube URL recorded for any of the keys, or None"""
+        keys = [key for key in keys if key]
+        if not keys:
+            return None
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT youtube_url FROM uploads WHERE key IN ({', '.join('?' * len(keys))}) LIMIT 1",
+                keys
+            ).fetchone()
+        return row[0] if row else None
+
+    def record(self, youtube_url: str, *keys):
+        """Remember that the content behind the keys is uploaded as youtube_url"""
+        now = datetime.now().isoformat()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO uploads (key, youtube_url, created_at) VALUES (?, ?, ?)",
+                [(key, youtube_url, now) for key in keys if key]
+            )
+        logger.info(f"Recorded {len(keys)} dedup key(s) for {youtube_url}")
@@ -0,0 +1,66 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+class UploadSessionStore:
+    """Persist resumable upload sessions on disk so they survive a restart"""
+
+    def __init__(self, directory: Path = None):
+        self.directory = Path(directory or Config.UPLOAD_SESSION_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return self.directory / f"{digest}.json"
+
+    def _write(self, key: str, record: dict):
+        path = self._path(key)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    def save(self, key: str, upload_uri: str, file_path: str, file_size: int,
+             video_info: dict, credential: str = None):
+        """Record a new upload session"""
+        self._write(key, {
+            'key': key,
+            'upload_uri': upload_uri,
+            'credential': credential,
+            'file_path': str(file_path),
+            'file_size': file_size,
+            'offset': 0,
+            'video_info': video_info,
+            'created_at': datetime.now().isoformat()
+        })
+
+    def update_offset(self, key: str, offset: int):
+        """Checkpoint the number of bytes acknowledged by the session"""
+        record = self.get(key)
+        if record:
+            record['offset'] = offset
+            self._write(key, record)
+
+    def get(self, key: str) -> dict:
+        """Get a stored session, or None"""
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable upload session {path.name}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+
+    def remove(self, key: str):
+        """Forget a finished or abandoned session"""
+        self._path(key).unlink(missing_ok=True)
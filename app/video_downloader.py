@@ -1,17 +1,35 @@
+import sys
+import copy
+import json
+import time
 import asyncio
 import logging
+import threading
 import yt_dlp
+from collections import OrderedDict
 from pathlib import Path
+from urllib.parse import urlsplit
 import re
 
 from .config import Config
+from .ydl_pool import YoutubeDLPool, HostConnectionLimiter
+from .format_selector import FormatSelector
+from .ydl_process import YtdlpProcessPool
 
 logger = logging.getLogger(__name__)
 
 class VideoDownloader:
-    def __init__(self):
+    # Protocols yt-dlp can write to stdout without an ffmpeg merge or remux
+    STREAMABLE_PROTOCOLS = ('http', 'https')
+    STREAM_CHUNK_SIZE = 1024 * 1024
+    # Protocols downloaded fragment by fragment, which can use parallel connections
+    FRAGMENTED_PROTOCOLS = ('m3u8', 'm3u8_native', 'http_dash_segments', 'dash_frag_urls')
+    MERGE_OUTPUT_FORMAT = 'mp4'
+
+    def __init__(self, process_workers: int = None):
         self.ydl_opts = {
-            'format': 'best[height<=1080][filesize<2G]/best[filesize<2G]/best',
+            'format': FormatSelector(Config.FORMAT_MIN_HEIGHT, Config.FORMAT_MAX_HEIGHT, Config.MAX_FILE_SIZE,
+                                     self.MERGE_OUTPUT_FORMAT),
             'outtmpl': '%(title)s.%(ext)s',
             'noplaylist': True,
             'extractaudio': False,
@@ -28,11 +46,27 @@ class VideoDownloader:
             'no_check_certificate': True,
             'prefer_ffmpeg': True,
             'keepvideo': False,
-            'merge_output_format': 'mp4',
+            'merge_output_format': self.MERGE_OUTPUT_FORMAT,
+            'concurrent_fragment_downloads': Config.YTDL_CONCURRENT_FRAGMENTS,
+            'http_chunk_size': Config.YTDL_HTTP_CHUNK_SIZE or None,
         }
+        # Raw extractor results by URL, so analysis and download extract only once
+        self._info_cache = OrderedDict()
+        self._info_cache_lock = threading.Lock()
+        self.ydl_pool = YoutubeDLPool(self.ydl_opts, Config.YTDL_POOL_SIZE)
+        self.host_limiter = HostConnectionLimiter(Config.YTDL_MAX_CONNECTIONS_PER_HOST)
+        
+        # Optionally move analysis and downloads out of the bot process
+        if process_workers is None:
+            process_workers = Config.YTDL_PROCESS_WORKERS
+        self.process_pool = YtdlpProcessPool(process_workers) if process_workers > 0 else None
+
+    async def download_video(self, url: str, output_dir: Path, progress_callback=None) -> dict:
+        """Download video from URL into output_dir, which should belong to this job alone.
 
-    async def download_video(self, url: str, output_dir: Path) -> dict:
-        """Download video from URL"""
+        progress_callback, if given, is called on the event loop with
+        (downloaded_bytes, total_bytes) while yt-dlp downloads.
+        """
         try:
             # Clean and validate URL
             url = url.strip()
@@ -42,17 +76,159 @@ class VideoDownloader:
                     'error': 'Invalid URL format'
                 }
             
-            # Update output template with directory
-            sanitized_template = str(output_dir / '%(title).100s.%(ext)s')
-            self.ydl_opts['outtmpl'] = sanitized_template
+            output_dir.mkdir(parents=True, exist_ok=True)
             
             # Get video info first
             logger.info(f"Extracting info for: {url}")
             
-            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                info = await asyncio.get_event_loop().run_in_executor(
-                    None, ydl.extract_info, url, False
-                )
+            if self.process_pool:
+                return await self.process_pool.download_video(url, output_dir, progress_callback)
+            
+            loop = asyncio.get_event_loop()
+            
+            def on_progress(status):
+                if progress_callback and status['status'] == 'downloading':
+                    loop.call_soon_threadsafe(progress_callback, *self._progress_message(status))
+            
+            async with self.ydl_pool.checkout(progress_hooks=[on_progress],
+                                              **self._download_params(output_dir)) as pooled:
+                return await pooled.run(self._download_sync, pooled, url)
+                
+        except Exception as e:
+            logger.error(f"Download failed: {e}")
+            return {
+                'success': False,
+                'error': f"Unexpected error: {str(e)}"
+            }
+
+    @staticmethod
+    def _download_params(output_dir: Path) -> dict:
+        """Per-job YoutubeDL params that keep every file inside output_dir"""
+        return {
+            'paths': {'home': str(output_dir), 'temp': str(output_dir)},
+            'outtmpl': {'default': '%(id).100s.%(ext)s'},
+        }
+
+    @staticmethod
+    def _progress_message(status: dict) -> tuple:
+        """Reduce a yt-dlp progress hook status to (downloaded_bytes, total_bytes)"""
+        return (status.get('downloaded_bytes') or 0,
+                status.get('total_bytes') or status.get('total_bytes_estimate') or 0)
+
+    def _download_sync(self, pooled, url: str) -> dict:
+        """Resolve and download a URL on a checked-out YoutubeDL.
+
+        Blocking; runs in a worker thread, or in a child process when
+        YTDL_PROCESS_WORKERS is set.
+        """
+        # Post-processors report the final path of each file they produce
+        final_paths = []
+        
+        def on_postprocessor(status):
+            if status['status'] == 'finished' and status['info_dict'].get('filepath'):
+                final_paths.append(status['info_dict']['filepath'])
+        
+        ydl = pooled.ydl
+        pooled.postprocessor_hooks.append(on_postprocessor)
+        try:
+            info = self._resolve_info(ydl, url)
+            
+            if not info:
+                return {
+                    'success': False,
+                    'error': 'Unable to extract video information'
+                }
+            
+            error = self._check_info(info)
+            if error:
+                return {
+                    'success': False,
+                    'error': error
+                }
+            
+            logger.info(f"Starting download: {info.get('title', 'Unknown')}")
+            
+            # Download the already resolved video instead of extracting the URL again,
+            # with as many parallel fragment connections as the host cap allows
+            host, wanted = self._connection_demand(info)
+            with self.host_limiter.acquire(host, wanted) as granted:
+                saved = pooled.apply_params({'concurrent_fragment_downloads': granted})
+                try:
+                    info = ydl.process_ie_result(info, download=True)
+                finally:
+                    pooled.restore_params(saved)
+            
+        except yt_dlp.DownloadError as e:
+            logger.error(f"Download error: {e}")
+            self._forget_info(url)
+            return {
+                'success': False,
+                'error': f"Download failed: {self._download_error_message(e)}"
+            }
+        finally:
+            pooled.postprocessor_hooks.remove(on_postprocessor)
+        
+        # yt-dlp reports where the final file ended up after merging and post-processing
+        file_path = None
+        if info.get('requested_downloads'):
+            file_path = info['requested_downloads'][-1].get('filepath')
+        if not file_path and final_paths:
+            file_path = final_paths[-1]
+        
+        if not file_path or not Path(file_path).exists():
+            return {
+                'success': False,
+                'error': 'Downloaded file not found'
+            }
+        file_path = Path(file_path)
+        
+        # Check actual file size
+        actual_size = file_path.stat().st_size
+        if actual_size > Config.MAX_FILE_SIZE:
+            file_path.unlink()  # Delete oversized file
+            return {
+                'success': False,
+                'error': f"File too large: {actual_size/(1024*1024):.1f} MB (max: {Config.MAX_FILE_SIZE/(1024*1024):.1f} MB)"
+            }
+        
+        # Check if file is actually a video (minimum size check)
+        if actual_size < 1024 * 10:  # Less than 10KB
+            file_path.unlink()
+            return {
+                'success': False,
+                'error': 'Downloaded file is too small or corrupted'
+            }
+        
+        logger.info(f"Successfully downloaded: {file_path.name} ({actual_size/(1024*1024):.1f} MB)")
+        
+        return {
+            'success': True,
+            'file_path': str(file_path),
+            'info': self._build_info(info, url, actual_size)
+        }
+
+    async def open_stream(self, url: str, output_dir: Path) -> dict:
+        """Open yt-dlp output as a stream of chunks for single-file formats.
+
+        The resolved info handed to the streaming process is written to
+        output_dir, which should belong to this job alone.
+
+        Returns 'fallback': True when the selected format needs an ffmpeg
+        merge or remux, in which case download_video must be used instead.
+        """
+        try:
+            url = url.strip()
+            if not self._is_valid_url(url):
+                return {
+                    'success': False,
+                    'error': 'Invalid URL format'
+                }
+            
+            logger.info(f"Extracting info for streaming: {url}")
+            
+            async with self.ydl_pool.checkout() as pooled:
+                ydl = pooled.ydl
+                info = await pooled.run(self._resolve_info, ydl, url)
                 
                 if not info:
                     return {
@@ -60,157 +236,180 @@ class VideoDownloader:
                         'error': 'Unable to extract video information'
                     }
                 
-                # Check if it's a live stream
-                if info.get('is_live', False):
+                error = self._check_info(info)
+                if error:
                     return {
                         'success': False,
-                        'error': 'Live streams are not supported'
+                        'error': error
                     }
                 
-                # Check duration
-                duration = info.get('duration', 0)
-                if duration and duration > Config.MAX_VIDEO_DURATION:
+                if info.get('requested_formats') or info.get('protocol') not in self.STREAMABLE_PROTOCOLS:
+                    logger.info(f"Format {info.get('format_id')} needs a merge or remux, using a temp file")
                     return {
                         'success': False,
-                        'error': f"Video too long: {duration//60} minutes (max: {Config.MAX_VIDEO_DURATION//60} minutes)"
+                        'fallback': True
                     }
                 
-                # Check file size estimate
-                filesize = info.get('filesize') or info.get('filesize_approx', 0)
-                if filesize and filesize > Config.MAX_FILE_SIZE:
-                    return {
-                        'success': False,
-                        'error': f"File too large: {filesize/(1024*1024):.1f} MB (max: {Config.MAX_FILE_SIZE/(1024*1024):.1f} MB)"
-                    }
-                
-                # Check if video is available
-                availability = info.get('availability', 'public')
-                if availability in ['private', 'subscriber_only', 'needs_auth']:
-                    return {
-                        'success': False,
-                        'error': f'Video is {availability} and cannot be downloaded'
-                    }
-                
-                logger.info(f"Starting download: {info.get('title', 'Unknown')}")
-                
-                # Download the video
-                await asyncio.get_event_loop().run_in_executor(
-                    None, ydl.download, [url]
-                )
-                
-                # Find downloaded file
-                title = self._sanitize_filename(info.get('title', 'video'))
-                ext = info.get('ext', 'mp4')
-                
-                # Try multiple file naming patterns
-                possible_files = [
-                    output_dir / f"{title}.{ext}",
-                    output_dir / f"{title[:50]}.{ext}",
-                    output_dir / f"{title[:100]}.{ext}",
-                    output_dir / f"{info.get('id', 'video')}.{ext}",
-                ]
-                
-                file_path = None
-                for pf in possible_files:
-                    if pf.exists():
-                        file_path = pf
-                        break
-                
-                # If not found, search for any new file in the directory
-                if not file_path:
-                    import time
-                    current_time = time.time()
-                    
-                    for file in output_dir.glob("*"):
-                        if (file.is_file() and 
-                            file.suffix.lower() in ['.mp4', '.mkv', '.avi', '.mov', '.webm', '.flv'] and
-                            (current_time - file.stat().st_mtime) < 300):  # 5 minutes ago
-                            file_path = file
-                            break
-                
-                if not file_path or not file_path.exists():
-                    return {
-                        'success': False,
-                        'error': 'Downloaded file not found'
-                    }
-                
-                # Check actual file size
-                actual_size = file_path.stat().st_size
-                if actual_size > Config.MAX_FILE_SIZE:
-                    file_path.unlink()  # Delete oversized file
-                    return {
-                        'success': False,
-                        'error': f"File too large: {actual_size/(1024*1024):.1f} MB (max: {Config.MAX_FILE_SIZE/(1024*1024):.1f} MB)"
-                    }
-                
-                # Check if file is actually a video (minimum size check)
-                if actual_size < 1024 * 10:  # Less than 10KB
-                    file_path.unlink()
-                    return {
-                        'success': False,
-                        'error': 'Downloaded file is too small or corrupted'
-                    }
-                
-                logger.info(f"Successfully downloaded: {file_path.name} ({actual_size/(1024*1024):.1f} MB)")
-                
-                return {
-                    'success': True,
-                    'file_path': str(file_path),
-                    'info': {
-                        'title': info.get('title', 'Downloaded Video'),
-                        'description': info.get('description', ''),
-                        'tags': self._extract_tags(info),
-                        'duration': duration,
-                        'uploader': info.get('uploader', ''),
-                        'upload_date': info.get('upload_date', ''),
-                        'view_count': info.get('view_count', 0),
-                        'like_count': info.get('like_count', 0),
-                        'webpage_url': info.get('webpage_url', url),
-                        'thumbnail': info.get('thumbnail', ''),
-                        'format': info.get('format', 'unknown'),
-                        'filesize': actual_size
-                    }
-                }
-                
-        except yt_dlp.DownloadError as e:
-            logger.error(f"Download error: {e}")
-            error_msg = str(e)
+                # Hand the resolved info to a yt-dlp process writing to stdout,
+                # so the video is not extracted a second time
+                output_dir.mkdir(parents=True, exist_ok=True)
+                info_path = output_dir / f"{info.get('id', 'video')}.info.json"
+                with open(info_path, 'w') as f:
+                    json.dump(ydl.sanitize_info(info), f)
             
-            # Provide more user-friendly error messages
-            if 'Video unavailable' in error_msg:
-                error_msg = 'Video is unavailable or has been removed'
-            elif 'Private video' in error_msg:
-                error_msg = 'Video is private and cannot be downloaded'
-            elif 'age-restricted' in error_msg.lower():
-                error_msg = 'Video is age-restricted and cannot be downloaded'
-            elif 'copyright' in error_msg.lower():
-                error_msg = 'Video is blocked due to copyright restrictions'
-            elif 'geoblocked' in error_msg.lower():
-                error_msg = 'Video is blocked in your region'
+            logger.info(f"Streaming format {info.get('format_id')}: {info.get('title', 'Unknown')}")
             
+            return {
+                'success': True,
+                'stream': self._stream_output(info_path, info['format_id']),
+                'filesize': info.get('filesize'),
+                'info': self._build_info(info, url, info.get('filesize') or info.get('filesize_approx', 0))
+            }
+            
+        except yt_dlp.DownloadError as e:
+            logger.error(f"Download error: {e}")
+            self._forget_info(url)
             return {
                 'success': False,
-                'error': f"Download failed: {error_msg}"
+                'error': f"Download failed: {self._download_error_message(e)}"
             }
         except Exception as e:
-            logger.error(f"Download failed: {e}")
+            logger.error(f"Stream setup failed: {e}")
             return {
                 'success': False,
                 'error': f"Unexpected error: {str(e)}"
             }
 
-    def _sanitize_filename(self, filename: str) -> str:
-        """Sanitize filename for filesystem compatibility"""
-        # Remove or replace invalid characters
-        filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-        filename = re.sub(r'[^\w\s-]', '', filename)
-        filename = re.sub(r'[-\s]+', '-', filename)
+    def close(self):
+        """Close the pooled YoutubeDL instances and worker processes"""
+        self.ydl_pool.close()
+        if self.process_pool:
+            self.process_pool.close()
+
+    def _extract(self, ydl, url: str) -> dict:
+        """Run the extractor for a URL, reusing a recent result from the info cache"""
+        with self._info_cache_lock:
+            entry = self._info_cache.get(url)
+            if entry and time.monotonic() - entry[0] < Config.INFO_CACHE_TTL:
+                self._info_cache.move_to_end(url)
+                logger.info(f"Reusing extracted info for: {url}")
+                return copy.deepcopy(entry[1])
         
-        # Limit length
-        if len(filename) > 100:
-            filename = filename[:100]
+        info = ydl.extract_info(url, download=False, process=False)
+        if not info:
+            return None
         
-        return filename.strip('-_')
+        with self._info_cache_lock:
+            self._info_cache[url] = (time.monotonic(), info)
+            self._info_cache.move_to_end(url)
+            while len(self._info_cache) > Config.INFO_CACHE_SIZE:
+                self._info_cache.popitem(last=False)
+        # Processing mutates the dict, keep the cached copy pristine
+        return copy.deepcopy(info)
+
+    def _resolve_info(self, ydl, url: str) -> dict:
+        """Get the info for a URL with formats selected, without downloading"""
+        info = self._extract(ydl, url)
+        return ydl.process_ie_result(info, download=False) if info else None
+
+    def _forget_info(self, url: str):
+        """Drop a cached extraction, e.g. after its format URLs stopped working"""
+        with self._info_cache_lock:
+            self._info_cache.pop(url, None)
+
+    async def _stream_output(self, info_path: Path, format_id: str):
+        """Run yt-dlp with output to stdout and yield what it writes"""
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, '-m', 'yt_dlp',
+            '--load-info-json', str(info_path),
+            '--format', format_id,
+            '--output', '-',
+            '--quiet', '--no-warnings', '--no-part', '--no-check-certificate',
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        
+        try:
+            received = 0
+            while True:
+                chunk = await process.stdout.read(self.STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                
+                received += len(chunk)
+                if received > Config.MAX_FILE_SIZE:
+                    raise Exception(f"File too large: over {Config.MAX_FILE_SIZE/(1024*1024):.1f} MB")
+                yield chunk
+            
+            returncode = await process.wait()
+            if returncode != 0:
+                stderr = (await process.stderr.read()).decode('utf-8', errors='replace')
+                raise Exception(f"yt-dlp exited with code {returncode}: {stderr.strip()[-500:]}")
+            
+            logger.info(f"Streamed {received/(1024*1024):.1f} MB from yt-dlp")
+            
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            info_path.unlink(missing_ok=True)
+
+    def _download_error_message(self, error: Exception) -> str:
+        """Provide more user-friendly error messages"""
+        error_msg = str(error)
+        
+        if 'Video unavailable' in error_msg:
+            error_msg = 'Video is unavailable or has been removed'
+        elif 'Private video' in error_msg:
+            error_msg = 'Video is private and cannot be downloaded'
+        elif 'age-restricted' in error_msg.lower():
+            error_msg = 'Video is age-restricted and cannot be downloaded'
+        elif 'copyright' in error_msg.lower():
+            error_msg = 'Video is blocked due to copyright restrictions'
+        elif 'geoblocked' in error_msg.lower():
+            error_msg = 'Video is blocked in your region'
+        
+        return error_msg
+
+    def _check_info(self, info: dict) -> str:
+        """Check extracted info against our limits, returning an error message or None"""
+        # Check if it's a live stream
+        if info.get('is_live', False):
+            return 'Live streams are not supported'
+        
+        # Check duration
+        duration = info.get('duration', 0)
+        if duration and duration > Config.MAX_VIDEO_DURATION:
+            return f"Video too long: {duration//60} minutes (max: {Config.MAX_VIDEO_DURATION//60} minutes)"
+        
+        # Check file size estimate
+        filesize = info.get('filesize') or info.get('filesize_approx', 0)
+        if filesize and filesize > Config.MAX_FILE_SIZE:
+            return f"File too large: {filesize/(1024*1024):.1f} MB (max: {Config.MAX_FILE_SIZE/(1024*1024):.1f} MB)"
+        
+        # Check if video is available
+        availability = info.get('availability', 'public')
+        if availability in ['private', 'subscriber_only', 'needs_auth']:
+            return f'Video is {availability} and cannot be downloaded'
+        
+        return None
+
+    def _build_info(self, info: dict, url: str, filesize: int) -> dict:
+        """Build the video info returned to the bot"""
+        return {
+            'title': info.get('title', 'Downloaded Video'),
+            'description': info.get('description', ''),
+            'tags': self._extract_tags(info),
+            'duration': info.get('duration', 0),
+            'uploader': info.get('uploader', ''),
+            'upload_date': info.get('upload_date', ''),
+            'view_count': info.get('view_count', 0),
+            'like_count': info.get('like_count', 0),
+            'webpage_url': info.get('webpage_url', url),
+            'thumbnail': info.get('thumbnail', ''),
+            'format': info.get('format', 'unknown'),
+            'filesize': filesize
+        }
 
     def _extract_tags(self, info: dict) -> list:
         """Extract relevant tags from video info"""
@@ -248,6 +447,49 @@ class VideoDownloader:
         
         return tags[:20]  # YouTube allows max 500 characters total for tags
 
+    def _connection_demand(self, info: dict) -> tuple:
+        """Get the host the selected formats download from and how many connections they can use"""
+        formats = info.get('requested_formats') or [info]
+        host = urlsplit(formats[0].get('url') or info.get('webpage_url', '')).hostname or ''
+        
+        # Progressive HTTP formats use one connection, fetched in http_chunk_size ranges
+        fragmented = any(
+            f.get('fragments') or f.get('protocol', '').split('+')[0] in self.FRAGMENTED_PROTOCOLS
+            for f in formats
+        )
+        return host, Config.YTDL_CONCURRENT_FRAGMENTS if fragmented else 1
+
+    def _get_info_sync(self, ydl, url: str) -> dict:
+        """Resolve a URL and summarize it for analysis; blocking like _download_sync"""
+        info = self._resolve_info(ydl, url)
+        
+        if info:
+            return {
+                'success': True,
+                'info': {
+                    'id': info.get('id', ''),
+                    'extractor': info.get('extractor_key', ''),
+                    'title': info.get('title', 'Unknown'),
+                    'duration': info.get('duration', 0),
+                    'uploader': info.get('uploader', ''),
+                    'view_count': info.get('view_count', 0),
+                    'like_count': info.get('like_count', 0),
+                    'description': (info.get('description', '')[:500] + '...') if info.get('description') else '',
+                    'thumbnail': info.get('thumbnail', ''),
+                    'webpage_url': info.get('webpage_url', url),
+                    'upload_date': info.get('upload_date', ''),
+                    'is_live': info.get('is_live', False),
+                    'availability': info.get('availability', 'unknown'),
+                    'filesize': info.get('filesize') or info.get('filesize_approx', 0),
+                    'needs_merge': bool(info.get('requested_formats'))
+                }
+            }
+        else:
+            return {
+                'success': False,
+                'error': 'Unable to extract video information'
+            }
+
     def _is_valid_url(self, url: str) -> bool:
         """Check if URL is valid"""
         url_pattern = re.compile(
@@ -273,34 +515,12 @@ class VideoDownloader:
             
             logger.info(f"Getting info for: {url}")
             
-            with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
-                info = await asyncio.get_event_loop().run_in_executor(
-                    None, ydl.extract_info, url, False
-                )
-                
-                if info:
-                    return {
-                        'success': True,
-                        'info': {
-                            'title': info.get('title', 'Unknown'),
-                            'duration': info.get('duration', 0),
-                            'uploader': info.get('uploader', ''),
-                            'view_count': info.get('view_count', 0),
-                            'like_count': info.get('like_count', 0),
-                            'description': (info.get('description', '')[:500] + '...') if info.get('description') else '',
-                            'thumbnail': info.get('thumbnail', ''),
-                            'webpage_url': info.get('webpage_url', url),
-                            'upload_date': info.get('upload_date', ''),
-                            'is_live': info.get('is_live', False),
-                            'availability': info.get('availability', 'unknown'),
-                            'filesize': info.get('filesize') or info.get('filesize_approx', 0)
-                        }
-                    }
-                else:
-                    return {
-                        'success': False,
-                        'error': 'Unable to extract video information'
-                    }
+            if self.process_pool:
+                return await self.process_pool.get_video_info(url)
+            
+            # Same options as the download so the cached extraction can be reused there
+            async with self.ydl_pool.checkout() as pooled:
+                return await pooled.run(self._get_info_sync, pooled.ydl, url)
                     
         except Exception as e:
             logger.error(f"Info extraction failed: {e}")
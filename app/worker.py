@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from pyrogram import Client, idle
+
+from .config import Config
+from .youtube_uploader import YouTubeUploader
+from .video_downloader import VideoDownloader
+from .scheduler import JobScheduler
+from .job_store import open_job_store
+from .pipeline import JobPipeline
+from .media_pool import MediaClientPool
+from .outbox import Outbox
+
+# Configure logging
+logging.basicConfig(
+    level=getattr(logging, Config.LOG_LEVEL),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+class UploadWorker:
+    """Worker process that claims jobs from the shared queue and runs them.
+
+    The bot front-end (RUN_MODE=frontend) only enqueues jobs; any number of
+    these workers do the downloading and uploading. Each worker has its own
+    bot session that receives no updates and is used to fetch media and
+    edit status messages.
+    """
+
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+        self.app = Client(
+            f"worker_{worker_id}",
+            api_id=Config.API_ID,
+            api_hash=Config.API_HASH,
+            bot_token=Config.BOT_TOKEN,
+            workdir=str(Config.SESSION_DIR),
+            no_updates=True,
+            # Without media clients all connections of a download go through this one
+            max_concurrent_transmissions=max(Config.TELEGRAM_DOWNLOAD_CONNECTIONS,
+                                             Config.TELEGRAM_TRANSMISSIONS_PER_CLIENT)
+        )
+
+        self.youtube_uploader = YouTubeUploader()
+        self.video_downloader = VideoDownloader()
+        self.job_store = open_job_store()
+        self.scheduler = JobScheduler(self.run_job)
+        self.media_pool = MediaClientPool(f"worker_{worker_id}", Config.MEDIA_CLIENTS, self.app)
+        self.outbox = Outbox(self.app)
+        self.pipeline = JobPipeline(
+            self.app, self.job_store, self.youtube_uploader, self.video_downloader, self.scheduler,
+            self.media_pool, self.outbox
+        )
+
+    async def run_job(self, job: dict):
+        """Run a claimed job"""
+        await self.pipeline.run_job(job)
+
+    async def _work(self):
+        """Claim and run jobs one at a time until cancelled"""
+        while True:
+            try:
+                job = await asyncio.get_event_loop().run_in_executor(
+                    None, self.job_store.claim, self.worker_id, 5
+                )
+            except Exception as e:
+                logger.error(f"Failed to claim a job: {e}")
+                await asyncio.sleep(5)
+                continue
+
+            if job:
+                logger.info(f"Worker {self.worker_id} claimed job {job['id']} ({job['kind']}, stage {job['stage']})")
+                await self.run_job(job)
+
+    async def _heartbeat(self):
+        """Keep our claims alive and put back jobs of dead workers"""
+        while True:
+            try:
+                self.job_store.heartbeat(self.worker_id)
+                self.job_store.requeue_stale(Config.JOB_CLAIM_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Heartbeat failed: {e}")
+            await asyncio.sleep(Config.JOB_CLAIM_TIMEOUT / 3)
+
+    async def _main(self):
+        """Start the client and the job loops, idle until stopped"""
+        await self.app.start()
+        await self.media_pool.start()
+
+        # Jobs we held when we last stopped go back to the queue
+        self.job_store.release(self.worker_id)
+
+        tasks = [
+            asyncio.create_task(self._heartbeat()),
+            asyncio.create_task(self.youtube_uploader.run_token_refresher()),
+            asyncio.create_task(self.pipeline.run_janitor())
+        ]
+        tasks += [asyncio.create_task(self._work()) for _ in range(Config.WORKER_CONCURRENCY)]
+
+        await idle()
+
+        for task in tasks:
+            task.cancel()
+        self.job_store.release(self.worker_id)
+        await self.media_pool.stop()
+        await self.youtube_uploader.close()
+        self.video_downloader.close()
+        await self.app.stop()
+
+    def run(self):
+        """Start the worker"""
+        logger.info(f"Starting upload worker {self.worker_id}...")
+        logger.info(f"Queue backend: {Config.JOB_QUEUE_BACKEND}")
+        logger.info(f"Concurrent jobs: {Config.WORKER_CONCURRENCY}")
+
+        Config.SESSION_DIR.mkdir(parents=True, exist_ok=True)
+        Config.TEMP_DIR.mkdir(parents=True, exist_ok=True)
+
+        self.app.run(self._main())
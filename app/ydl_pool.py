@@ -0,0 +1,150 @@
+import copy
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager, contextmanager
+import yt_dlp
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class PooledYoutubeDL:
+    """A long-lived YoutubeDL checked out by one job at a time"""
+
+    def __init__(self, params: dict):
+        # YoutubeDL keeps the dict it is given, so every instance needs its own
+        # copy or per-job params would leak into the jobs of other instances.
+        # The format selector holds no state and is shared.
+        own_params = copy.deepcopy({key: value for key, value in params.items() if key != 'format'})
+        if 'format' in params:
+            own_params['format'] = params['format']
+        self.ydl = yt_dlp.YoutubeDL(own_params)
+        self.progress_hooks = []
+        self.postprocessor_hooks = []
+        self._pending = set()
+
+        # Hooks are registered once; per-job hooks are dispatched from these lists
+        self.ydl.add_progress_hook(lambda d: self._dispatch(self.progress_hooks, d))
+        self.ydl.add_postprocessor_hook(lambda d: self._dispatch(self.postprocessor_hooks, d))
+
+    @staticmethod
+    def _dispatch(hooks: list, status: dict):
+        for hook in list(hooks):
+            hook(status)
+
+    def apply_params(self, params: dict) -> dict:
+        """Apply per-job params, returning what is needed to restore them"""
+        saved = {key: self.ydl.params.get(key, _MISSING) for key in params}
+        self.ydl.params.update(params)
+        return saved
+
+    def restore_params(self, saved: dict):
+        """Undo apply_params()"""
+        for key, value in saved.items():
+            if value is _MISSING:
+                self.ydl.params.pop(key, None)
+            else:
+                self.ydl.params[key] = value
+
+    async def run(self, func, *args):
+        """Run a blocking yt-dlp call in the executor"""
+        future = asyncio.get_event_loop().run_in_executor(None, func, *args)
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        return await future
+
+
+class HostConnectionLimiter:
+    """Caps the download connections all jobs together open to one host.
+
+    A job asks for as many connections as it would like and is granted what
+    is left under the cap, waiting only when the host has none to spare.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._in_use = {}
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def acquire(self, host: str, wanted: int):
+        """Hold up to `wanted` connections to host; yields the number granted"""
+        with self._condition:
+            while self._in_use.get(host, 0) >= self.limit:
+                self._condition.wait()
+            granted = max(1, min(wanted, self.limit - self._in_use.get(host, 0)))
+            self._in_use[host] = self._in_use.get(host, 0) + granted
+
+        try:
+            yield granted
+        finally:
+            with self._condition:
+                self._in_use[host] -= granted
+                if not self._in_use[host]:
+                    del self._in_use[host]
+                self._condition.notify_all()
+
+
+class YoutubeDLPool:
+    """Bounded pool of pre-initialized YoutubeDL instances.
+
+    Reusing instances keeps their HTTP connections, cookies and extractor
+    caches (such as decoded YouTube player code) between jobs. Options a
+    job passes to checkout() are applied for that job only and restored
+    when the instance goes back to the pool.
+    """
+
+    def __init__(self, params: dict, size: int):
+        self.params = params
+        self.size = size
+        self._idle = asyncio.Queue()
+        self._created = 0
+
+    @asynccontextmanager
+    async def checkout(self, progress_hooks=(), postprocessor_hooks=(), **params):
+        """Borrow an instance with per-job params and hooks applied"""
+        if self._idle.empty() and self._created < self.size:
+            self._created += 1
+            try:
+                pooled = await asyncio.get_event_loop().run_in_executor(None, PooledYoutubeDL, self.params)
+            except Exception:
+                self._created -= 1
+                raise
+            logger.debug(f"Created pooled YoutubeDL instance {self._created}/{self.size}")
+        else:
+            pooled = await self._idle.get()
+
+        saved = pooled.apply_params(params)
+        pooled.progress_hooks.extend(progress_hooks)
+        pooled.postprocessor_hooks.extend(postprocessor_hooks)
+        try:
+            yield pooled
+        finally:
+            self._release(pooled, saved)
+
+    def _release(self, pooled: PooledYoutubeDL, saved: dict):
+        """Restore an instance and return it once no executor call is using it.
+
+        A cancelled job can leave its yt-dlp call running in a thread; the
+        instance only goes back to the pool after that call has finished.
+        """
+        pending = [future for future in pooled._pending if not future.done()]
+        if pending:
+            pending[0].add_done_callback(lambda _: self._release(pooled, saved))
+            return
+
+        pooled.restore_params(saved)
+        pooled.progress_hooks.clear()
+        pooled.postprocessor_hooks.clear()
+        self._idle.put_nowait(pooled)
+
+    def close(self):
+        """Close idle instances, saving their cookies"""
+        while not self._idle.empty():
+            pooled = self._idle.get_nowait()
+            try:
+                pooled.ydl.close()
+            except Exception as e:
+                logger.warning(f"Failed to close YoutubeDL instance: {e}")
+            self._created -= 1
@@ -0,0 +1,142 @@
+import time
+import asyncio
+import logging
+import itertools
+import threading
+import zlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Progress messages sent per download are limited to one per interval
+PROGRESS_INTERVAL = 0.5
+
+# State of a worker process, set up by _init_worker
+_events = None
+_connection_share = None
+_downloader = None
+_pooled = None
+
+def _init_worker(events, connection_share):
+    global _events, _connection_share
+    _events = events
+    _connection_share = connection_share
+    logging.basicConfig(
+        level=getattr(logging, Config.LOG_LEVEL),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+def _worker_state():
+    """Create this process's downloader and YoutubeDL on first use"""
+    global _downloader, _pooled
+    if _downloader is None:
+        from .video_downloader import VideoDownloader
+        from .ydl_pool import PooledYoutubeDL, HostConnectionLimiter
+        _downloader = VideoDownloader(process_workers=0)
+        # Workers split the per-host connection cap between them
+        _downloader.host_limiter = HostConnectionLimiter(_connection_share)
+        _pooled = PooledYoutubeDL(_downloader.ydl_opts)
+    return _downloader, _pooled
+
+def _get_video_info(url: str) -> dict:
+    downloader, pooled = _worker_state()
+    try:
+        return downloader._get_info_sync(pooled.ydl, url)
+    except Exception as e:
+        logger.error(f"Info extraction failed: {e}")
+        return {
+            'success': False,
+            'error': f"Failed to get video info: {str(e)}"
+        }
+
+def _download_video(url: str, output_dir: str, task_id: int) -> dict:
+    downloader, pooled = _worker_state()
+    last_sent = 0
+
+    def on_progress(status):
+        nonlocal last_sent
+        if status['status'] != 'downloading' or time.monotonic() - last_sent < PROGRESS_INTERVAL:
+            return
+        last_sent = time.monotonic()
+        _events.put((task_id, *downloader._progress_message(status)))
+
+    saved = pooled.apply_params(downloader._download_params(Path(output_dir)))
+    pooled.progress_hooks.append(on_progress)
+    try:
+        return downloader._download_sync(pooled, url)
+    except Exception as e:
+        logger.error(f"Download failed: {e}")
+        return {
+            'success': False,
+            'error': f"Unexpected error: {str(e)}"
+        }
+    finally:
+        pooled.progress_hooks.remove(on_progress)
+        pooled.restore_params(saved)
+
+
+class YtdlpProcessPool:
+    """Runs yt-dlp analysis and downloads in worker processes.
+
+    Extraction and format processing are CPU-bound Python and hold the GIL,
+    which otherwise stalls the bot's event loop while several jobs run. Each
+    worker keeps its own YoutubeDL and info cache, and a URL always goes to
+    the same worker so its download reuses the extraction from analysis.
+    Results come back as plain dicts and progress as small
+    (task_id, downloaded, total) tuples over a shared queue.
+    """
+
+    def __init__(self, workers: int):
+        context = multiprocessing.get_context('spawn')
+        self._events = context.Queue()
+        connection_share = max(1, Config.YTDL_MAX_CONNECTIONS_PER_HOST // workers)
+        self._executors = [
+            ProcessPoolExecutor(1, mp_context=context, initializer=_init_worker,
+                                initargs=(self._events, connection_share))
+            for _ in range(workers)
+        ]
+        self._callbacks = {}
+        self._task_ids = itertools.count()
+        self._reader = threading.Thread(target=self._read_events, name='ytdlp-progress', daemon=True)
+        self._reader.start()
+        logger.info(f"Running yt-dlp in {workers} worker process(es)")
+
+    def _executor(self, url: str) -> ProcessPoolExecutor:
+        return self._executors[zlib.crc32(url.encode()) % len(self._executors)]
+
+    def _read_events(self):
+        """Forward progress messages from the workers to their callbacks"""
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+            task_id, downloaded, total = event
+            entry = self._callbacks.get(task_id)
+            if entry:
+                loop, callback = entry
+                loop.call_soon_threadsafe(callback, downloaded, total)
+
+    async def get_video_info(self, url: str) -> dict:
+        return await asyncio.get_event_loop().run_in_executor(self._executor(url), _get_video_info, url)
+
+    async def download_video(self, url: str, output_dir: Path, progress_callback=None) -> dict:
+        loop = asyncio.get_event_loop()
+        task_id = next(self._task_ids)
+        if progress_callback:
+            self._callbacks[task_id] = (loop, progress_callback)
+        try:
+            return await loop.run_in_executor(
+                self._executor(url), _download_video, url, str(output_dir), task_id
+            )
+        finally:
+            self._callbacks.pop(task_id, None)
+
+    def close(self):
+        """Stop the worker processes and the progress reader"""
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._events.put(None)
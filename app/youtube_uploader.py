@@ -1,150 +1,155 @@
 
 import os
+import time
 import asyncio
 import logging
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+import aiohttp
+import httplib2
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
 from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 import json
+from datetime import datetime
 from pathlib import Path
-import time
 
 from .config import Config
+from .resumable_upload import (
+    ResumableUpload, ResumableUploadError, FileMedia, StreamMedia,
+    AuthorizedHttpPool, Httplib2Transport, AiohttpTransport
+)
+from .upload_sessions import UploadSessionStore
+from .quota import API_COSTS
+from .credential_pool import CredentialPool, CredentialFailure, QuotaReservation
 
 logger = logging.getLogger(__name__)
 
+API_URL = 'https://www.googleapis.com/youtube/v3'
+
 class YouTubeUploader:
+    # Parsed discovery document, shared by every uploader in the process
+    _discovery_document = None
+
     def __init__(self):
         self.credentials = None
         self.youtube_service = None
+        self.authorized_http = None
         self.auth_method = "None"
+        self.auth_valid_until = 0
+        self.channel_info = None
         self.scopes = [
             'https://www.googleapis.com/auth/youtube.upload',
             'https://www.googleapis.com/auth/youtube'
         ]
-        self.max_retries = 3
+        self.max_retries = Config.UPLOAD_MAX_RETRIES
+        self.session_store = UploadSessionStore()
+        self.pool = CredentialPool(self.scopes)
+        self.primary = None
+        self.http_session = None
+        self.http_pools = {}
         
     async def initialize(self):
         """Initialize YouTube service"""
         return await self.authenticate()
         
     async def authenticate(self):
-        """Authenticate with Google (try service account first, then OAuth)"""
+        """Authenticate with Google, loading every service account and OAuth token of the pool"""
+        started = time.perf_counter()
+        service_built = self.youtube_service is None
         try:
-            # Try service account authentication first
-            if await self._authenticate_service_account():
-                self.auth_method = "Service Account"
-                logger.info("Authenticated using service account")
-                return True
+            count = await asyncio.get_event_loop().run_in_executor(None, self.pool.load)
             
-            # Fall back to OAuth authentication
-            if await self._authenticate_oauth():
-                self.auth_method = "OAuth 2.0"
-                logger.info("Authenticated using OAuth")
-                return True
+            # Account-level calls (auth checks, channel info) go through the first healthy credential
+            primary = self.pool.primary()
+            if not primary:
+                self.auth_method = "None"
+                logger.error("All authentication methods failed")
+                return False
             
-            self.auth_method = "None"
-            logger.error("All authentication methods failed")
-            return False
+            self.primary = primary
+            self._use_credentials(primary.credentials)
+            self.auth_method = primary.auth_method
+            if count > 1:
+                self.auth_method += f" (pool of {count})"
+            logger.info(f"Authenticated using {primary.name} ({primary.auth_method})")
+            return True
             
         except Exception as e:
             self.auth_method = "Error"
             logger.error(f"Authentication failed: {e}")
             return False
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            mode = "built service" if service_built and self.youtube_service else "reused service"
+            logger.info(f"authenticate() took {elapsed:.1f} ms ({mode})")
 
-    async def _authenticate_service_account(self):
-        """Authenticate using service account"""
-        try:
-            # Try from environment variable first
-            if Config.GOOGLE_SERVICE_ACCOUNT_JSON:
-                service_account_info = json.loads(Config.GOOGLE_SERVICE_ACCOUNT_JSON)
-                self.credentials = service_account.Credentials.from_service_account_info(
-                    service_account_info, scopes=self.scopes
-                )
-                self.youtube_service = build('youtube', 'v3', credentials=self.credentials)
-                logger.info("Service account authentication successful (from env var)")
-                return True
-            
-            # Try from file
-            if Config.SERVICE_ACCOUNT_FILE.exists():
-                self.credentials = service_account.Credentials.from_service_account_file(
-                    str(Config.SERVICE_ACCOUNT_FILE), scopes=self.scopes
-                )
-                self.youtube_service = build('youtube', 'v3', credentials=self.credentials)
-                logger.info("Service account authentication successful (from file)")
-                return True
-            
-            logger.debug("No service account credentials found")
-            return False
-            
-        except Exception as e:
-            logger.warning(f"Service account authentication failed: {e}")
-            return False
+    @classmethod
+    def _get_discovery_document(cls) -> dict:
+        """Load and parse the bundled YouTube discovery document once per process"""
+        if cls._discovery_document is None:
+            document = get_static_doc('youtube', 'v3')
+            if document is None:
+                return None
+            cls._discovery_document = json.loads(document)
+        return cls._discovery_document
 
-    async def _authenticate_oauth(self):
-        """Authenticate using OAuth"""
-        try:
-            # Load existing token
-            if Config.TOKEN_FILE.exists():
-                try:
-                    self.credentials = Credentials.from_authorized_user_file(
-                        str(Config.TOKEN_FILE), self.scopes
-                    )
-                    logger.info("Loaded existing OAuth credentials")
-                except Exception as e:
-                    logger.warning(f"Failed to load existing credentials: {e}")
-                    self.credentials = None
-            
-            # Check if credentials are valid
-            if not self.credentials or not self.credentials.valid:
-                if self.credentials and self.credentials.expired and self.credentials.refresh_token:
-                    try:
-                        # Refresh expired credentials
-                        self.credentials.refresh(Request())
-                        
-                        # Save refreshed credentials
-                        Config.TOKEN_FILE.parent.mkdir(parents=True, exist_ok=True)
-                        with open(Config.TOKEN_FILE, 'w') as f:
-                            f.write(self.credentials.to_json())
-                            
-                        logger.info("OAuth credentials refreshed successfully")
-                    except Exception as e:
-                        logger.error(f"Failed to refresh credentials: {e}")
-                        return False
-                else:
-                    logger.debug("No valid OAuth credentials found. Interactive setup required.")
-                    return False
-            
-            # Build YouTube service
-            self.youtube_service = build('youtube', 'v3', credentials=self.credentials)
-            logger.info("OAuth authentication successful")
-            return True
-            
-        except Exception as e:
-            logger.warning(f"OAuth authentication failed: {e}")
-            return False
+    def _use_credentials(self, credentials):
+        """Point the YouTube service at new credentials.
+
+        The service is built once; later calls only swap the credentials of
+        its authorized http so the resource tree is not rebuilt on re-auth.
+        """
+        self.credentials = credentials
+        self.auth_valid_until = 0
+        self.channel_info = None
+        if self.youtube_service is not None:
+            self.authorized_http.credentials = credentials
+            return
+
+        self.authorized_http = AuthorizedHttp(credentials)
+        document = self._get_discovery_document()
+        if document is not None:
+            self.youtube_service = build_from_document(document, http=self.authorized_http)
+        else:
+            self.youtube_service = build('youtube', 'v3', http=self.authorized_http)
+
+    def _auth_cache_deadline(self) -> float:
+        """Monotonic time until which a successful auth check is trusted"""
+        ttl = Config.AUTH_CACHE_TTL
+        expiry = getattr(self.credentials, 'expiry', None)
+        if expiry:
+            # google-auth keeps expiry as naive UTC
+            ttl = min(ttl, (expiry - datetime.utcnow()).total_seconds())
+        return time.monotonic() + ttl
 
     async def check_authentication(self):
-        """Check if authentication is valid"""
+        """Check if authentication is valid.
+
+        A successful check is cached for AUTH_CACHE_TTL seconds, or until
+        the access token expires if that is sooner.
+        """
         try:
             if not self.youtube_service:
                 return await self.authenticate()
             
-            # Test API call
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, 
-                lambda: self.youtube_service.channels().list(part='snippet', mine=True).execute()
-            )
+            if time.monotonic() < self.auth_valid_until:
+                return True
+            
+            # Test API call, which also fills the channel info cache
+            response = await self._list_my_channel()
             
             if response and 'items' in response:
+                if response['items']:
+                    self.channel_info = response['items'][0]
+                self.auth_valid_until = self._auth_cache_deadline()
                 return True
             else:
+                self.auth_valid_until = 0
                 return False
                 
         except HttpError as e:
+            self.auth_valid_until = 0
             if e.resp.status == 401:  # Unauthorized
                 logger.warning("Authentication expired, attempting refresh")
                 return await self.authenticate()
@@ -152,15 +157,104 @@ class YouTubeUploader:
                 logger.error(f"API error during auth check: {e}")
                 return False
         except Exception as e:
+            self.auth_valid_until = 0
             logger.error(f"Authentication check failed: {e}")
             return False
 
+    async def run_token_refresher(self):
+        """Refresh the pool's access tokens shortly before they expire, until cancelled"""
+        while True:
+            delay = Config.AUTH_CACHE_TTL
+            for member in list(self.pool.members):
+                expiry = member.credentials.expiry
+                if not expiry:
+                    continue
+                
+                remaining = (expiry - datetime.utcnow()).total_seconds() - Config.TOKEN_REFRESH_MARGIN
+                if remaining > 0:
+                    delay = min(delay, remaining)
+                    continue
+                
+                try:
+                    await asyncio.get_event_loop().run_in_executor(None, member.credentials.refresh, Request())
+                    member.save_token()
+                    logger.info(f"Access token of {member.name} refreshed, valid until {member.credentials.expiry}")
+                except Exception as e:
+                    if member is self.primary:
+                        self.auth_valid_until = 0
+                    logger.warning(f"Background token refresh of {member.name} failed: {e}")
+                    self.pool.report_failure(member, 401)
+            
+            await asyncio.sleep(delay)
+
+    def _get_http_session(self) -> aiohttp.ClientSession:
+        """Get the shared aiohttp session, creating it on first use"""
+        if self.http_session is None or self.http_session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=Config.HTTP_POOL_SIZE,
+                keepalive_timeout=Config.HTTP_KEEPALIVE_TIMEOUT
+            )
+            self.http_session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=300)
+            )
+        return self.http_session
+
+    def _http_pool(self, member) -> AuthorizedHttpPool:
+        """Get the httplib2 client pool of a credential, replacing it after re-auth"""
+        pool = self.http_pools.get(member.name)
+        if pool is None or pool.credentials is not member.credentials:
+            pool = AuthorizedHttpPool(member.credentials, Config.HTTP_POOL_SIZE)
+            self.http_pools[member.name] = pool
+        return pool
+
+    def _transport(self, member):
+        """Get an HTTP transport authorized with a pool credential"""
+        if Config.YOUTUBE_HTTP_TRANSPORT == 'aiohttp':
+            return AiohttpTransport(self._get_http_session(), member.credentials)
+        return Httplib2Transport(self._http_pool(member))
+
+    async def _list_my_channel(self) -> dict:
+        """Call channels.list(mine=True) with the primary credential"""
+        if Config.YOUTUBE_HTTP_TRANSPORT == 'aiohttp':
+            uri = f"{API_URL}/channels?part=snippet,statistics&mine=true"
+            status, headers, content = await self._transport(self.primary).request(uri, 'GET')
+            if status != 200:
+                raise HttpError(httplib2.Response({'status': status}), content, uri=uri)
+            response = json.loads(content)
+        else:
+            request = self.youtube_service.channels().list(part='snippet,statistics', mine=True)
+            http_pool = self._http_pool(self.primary)
+
+            def _execute():
+                # The service's own http object is shared, run on a pooled client instead
+                with http_pool.client() as http:
+                    return request.execute(http=http)
+
+            response = await asyncio.get_event_loop().run_in_executor(None, _execute)
+        self.primary.quota.record('channels.list')
+        return response
+
+    async def close(self):
+        """Close pooled HTTP connections"""
+        if self.http_session and not self.http_session.closed:
+            await self.http_session.close()
+
     async def get_auth_method(self):
         """Get current authentication method"""
         return self.auth_method
 
-    async def upload_video(self, file_path: str, video_info: dict) -> str:
-        """Upload video to YouTube"""
+    async def upload_video(self, file_path: str, video_info: dict,
+                           session_key: str = None, progress_callback=None,
+                           reservation=None) -> str:
+        """Upload video to YouTube.
+
+        With a session_key the resumable session is persisted to disk and an
+        existing session for the same key and file is resumed instead of
+        starting a new upload. The upload runs on the credential of the given
+        quota reservation, or the least-loaded one, and moves to another
+        credential if Google rejects it.
+        """
         try:
             if not self.youtube_service:
                 if not await self.authenticate():
@@ -176,122 +270,196 @@ class YouTubeUploader:
             logger.info(f"Uploading file: {file_path} ({file_size / (1024*1024):.1f} MB)")
             
             # Prepare video metadata
-            body = {
-                'snippet': {
-                    'title': video_info['title'][:100],
-                    'description': video_info['description'][:5000],
-                    'tags': video_info.get('tags', [])[:500],
-                    'categoryId': video_info.get('category_id', '22')
-                },
-                'status': {
-                    'privacyStatus': video_info.get('privacy_status', Config.YOUTUBE_PRIVACY_STATUS),
-                    'selfDeclaredMadeForKids': False
-                }
-            }
+            body = self._build_body(video_info)
             
-            # Create media upload
-            media = MediaFileUpload(
-                file_path,
-                chunksize=-1,
-                resumable=True,
-                mimetype='video/*'
-            )
+            # Resume a persisted session for this file if there is one
+            upload_uri = None
+            if session_key:
+                record = self.session_store.get(session_key)
+                if record and record['file_path'] == str(file_path) and record['file_size'] == file_size:
+                    # A session can only be continued with the credential that opened it
+                    session_credential = self.pool.get(record.get('credential'))
+                    if session_credential:
+                        upload_uri = record['upload_uri']
+                        if not reservation or reservation.member is not session_credential:
+                            # The stored session was charged when it was opened
+                            reservation = QuotaReservation(session_credential, 0)
+                        logger.info(f"Resuming stored upload session at byte {record['offset']}")
+
+            def on_progress(uploaded, total):
+                if session_key:
+                    self.session_store.update_offset(session_key, uploaded)
+                if progress_callback:
+                    progress_callback(uploaded, total)
+
+            async def attempt(reservation, first):
+                member = reservation.member
+
+                def on_session(uri):
+                    self.pool.commit(reservation, 'videos.insert')
+                    if session_key:
+                        self.session_store.save(session_key, uri, file_path, file_size, video_info, member.name)
+
+                # Create chunked resumable upload
+                upload = ResumableUpload(
+                    self._transport(member),
+                    FileMedia(file_path),
+                    body,
+                    chunk_size=Config.UPLOAD_CHUNK_SIZE,
+                    max_retries=self.max_retries,
+                    upload_uri=upload_uri if first else None,
+                    progress_callback=on_progress,
+                    session_callback=on_session
+                )
+                return await self._execute_upload(upload, member)
+
+            try:
+                response = await self._run_with_failover(reservation, attempt)
+            except Exception:
+                if session_key:
+                    self.session_store.remove(session_key)
+                raise
+
+            if session_key:
+                self.session_store.remove(session_key)
             
-            # Execute upload
-            request = self.youtube_service.videos().insert(
-                part=','.join(body.keys()),
-                body=body,
-                media_body=media
-            )
+            return self._video_url(response)
             
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, self._execute_upload, request
-            )
+        except Exception as e:
+            logger.error(f"Upload failed: {e}")
+            return None
+
+    async def upload_stream(self, buffer, file_size: int, video_info: dict, reservation=None,
+                            progress_callback=None) -> str:
+        """Upload video from a StreamBuffer while it is still being downloaded"""
+        try:
+            if not self.youtube_service:
+                if not await self.authenticate():
+                    logger.error("Authentication required for upload")
+                    return None
             
-            if response and 'id' in response:
-                video_id = response['id']
-                youtube_url = f"https://www.youtube.com/watch?v={video_id}"
-                logger.info(f"Video uploaded successfully: {youtube_url}")
-                return youtube_url
-            else:
-                logger.error("Upload failed: No video ID in response")
-                return None
+            size_text = f"{file_size / (1024*1024):.1f} MB" if file_size else "unknown size"
+            logger.info(f"Streaming upload ({size_text})")
+            
+            # Failing over only works while no chunk has been acknowledged yet
+            media = StreamMedia(buffer, file_size)
+            
+            async def attempt(reservation, first):
+                upload = ResumableUpload(
+                    self._transport(reservation.member),
+                    media,
+                    self._build_body(video_info),
+                    chunk_size=Config.UPLOAD_CHUNK_SIZE,
+                    max_retries=self.max_retries,
+                    progress_callback=progress_callback,
+                    session_callback=lambda uri: self.pool.commit(reservation, 'videos.insert')
+                )
+                return await self._execute_upload(upload, reservation.member)
+
+            response = await self._run_with_failover(reservation, attempt)
+            return self._video_url(response)
             
         except Exception as e:
-            logger.error(f"Upload failed: {e}")
+            logger.error(f"Streaming upload failed: {e}")
             return None
-    
-    def _execute_upload(self, request):
-        """Execute the upload request with retry logic"""
-        for attempt in range(self.max_retries):
+
+    async def _run_with_failover(self, reservation, attempt):
+        """Run attempt(reservation, first) on pool credentials until one is not rejected"""
+        upload_cost = API_COSTS['videos.insert']
+        tried = []
+        failure = None
+        while True:
+            acquired = lease = None
+            if reservation is None:
+                reservation = acquired = self.pool.acquire(upload_cost, exclude=tried)
+                if reservation is None:
+                    if tried:
+                        raise failure
+                    raise Exception("No YouTube credential with quota left. Please try again later.")
+                lease = asyncio.create_task(self.pool.keep_lease(acquired))
+            
             try:
-                response = None
-                
-                logger.info(f"Starting upload attempt {attempt + 1}")
+                return await attempt(reservation, not tried)
+            except CredentialFailure as e:
+                failure = e
+                tried.append(reservation.member)
+                logger.warning(f"Upload with credential {reservation.member.name} rejected, trying the next one")
+                reservation = None
+            finally:
+                if acquired:
+                    lease.cancel()
+                    self.pool.release(acquired)
+
+    def _build_body(self, video_info: dict) -> dict:
+        """Build the videos.insert resource from our video info"""
+        return {
+            'snippet': {
+                'title': video_info['title'][:100],
+                'description': video_info['description'][:5000],
+                'tags': video_info.get('tags', [])[:500],
+                'categoryId': video_info.get('category_id', '22')
+            },
+            'status': {
+                'privacyStatus': video_info.get('privacy_status', Config.YOUTUBE_PRIVACY_STATUS),
+                'selfDeclaredMadeForKids': False
+            }
+        }
+
+    def _video_url(self, response: dict) -> str:
+        """Get the watch URL from an upload response"""
+        if response and 'id' in response:
+            video_id = response['id']
+            youtube_url = f"https://www.youtube.com/watch?v={video_id}"
+            logger.info(f"Video uploaded successfully: {youtube_url}")
+            return youtube_url
+        else:
+            logger.error("Upload failed: No video ID in response")
+            return None
+    
+    async def _execute_upload(self, upload: ResumableUpload, member):
+        """Execute the chunked upload, resuming from the last acknowledged byte on errors"""
+        try:
+            logger.info(f"Starting upload in {upload.chunk_size // (1024*1024)} MB chunks")
+            response = await upload.execute()
+            
+            if 'id' in response:
+                logger.info(f"Video uploaded successfully. Video ID: {response['id']}")
+                return response
+            else:
+                logger.error(f"Upload failed: {response}")
+                raise Exception(f"Upload failed: {response}")
                 
-                while response is None:
-                    try:
-                        status, response = request.next_chunk()
-                        
-                        if status:
-                            progress = int(status.progress() * 100)
-                            if progress % 10 == 0:  # Log every 10%
-                                logger.info(f"Upload progress: {progress}%")
-                        
-                        if response is not None:
-                            if 'id' in response:
-                                logger.info(f"Video uploaded successfully. Video ID: {response['id']}")
-                                return response
-                            else:
-                                logger.error(f"Upload failed: {response}")
-                                raise Exception(f"Upload failed: {response}")
-                                
-                    except HttpError as e:
-                        if e.resp.status in [500, 502, 503, 504]:
-                            # Retryable errors
-                            logger.warning(f"Retryable HTTP error: {e.resp.status}")
-                            time.sleep(2 ** attempt)
-                            continue
-                        elif e.resp.status == 401:
-                            # Unauthorized - need to re-authenticate
-                            logger.error("Authentication expired during upload")
-                            raise Exception("Authentication expired. Please re-authenticate.")
-                        elif e.resp.status == 403:
-                            # Forbidden - might be quota or permission issue
-                            logger.error("Upload forbidden - check quotas and permissions")
-                            raise Exception("Upload forbidden. Check YouTube API quotas and permissions.")
-                        else:
-                            # Non-retryable error
-                            logger.error(f"Non-retryable HTTP error: {e}")
-                            raise e
-                            
-            except Exception as e:
-                if attempt < self.max_retries - 1:
-                    wait_time = 2 ** attempt
-                    logger.warning(f"Upload attempt {attempt + 1} failed: {e}")
-                    logger.info(f"Retrying in {wait_time} seconds...")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    logger.error(f"Upload failed after {self.max_retries} attempts: {e}")
-                    raise e
-                    
-        return None
+        except ResumableUploadError as e:
+            content = e.content.decode('utf-8', errors='replace') if isinstance(e.content, bytes) else str(e.content)
+            if e.status == 401:
+                # Unauthorized - need to re-authenticate
+                logger.error(f"Authentication of {member.name} expired during upload")
+                self.pool.report_failure(member, e.status, content)
+                raise CredentialFailure("Authentication expired. Please re-authenticate.", e.status, content)
+            elif e.status == 403:
+                # Forbidden - might be quota or permission issue
+                logger.error(f"Upload with {member.name} forbidden - check quotas and permissions")
+                self.pool.report_failure(member, e.status, content)
+                raise CredentialFailure("Upload forbidden. Check YouTube API quotas and permissions.", e.status, content)
+            else:
+                logger.error(f"Non-retryable HTTP error: {e}")
+                raise
 
     async def get_channel_info(self):
-        """Get authenticated user's channel information"""
+        """Get authenticated user's channel information (cached until re-auth)"""
         try:
             if not self.youtube_service:
                 if not await self.authenticate():
                     return None
             
-            response = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.youtube_service.channels().list(part='snippet,statistics', mine=True).execute()
-            )
+            if self.channel_info:
+                return self.channel_info
+            
+            response = await self._list_my_channel()
             
             if response and 'items' in response and response['items']:
-                return response['items'][0]
+                self.channel_info = response['items'][0]
+                return self.channel_info
             else:
                 logger.warning("No channel found for authenticated user")
                 return None
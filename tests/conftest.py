@@ -0,0 +1,43 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Importing the app validates the configuration, so give it a complete one
+os.environ.setdefault('TELEGRAM_API_ID', '1')
+os.environ.setdefault('TELEGRAM_API_HASH', 'test')
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '1:test')
+os.environ.setdefault('GOOGLE_CLIENT_ID', 'test.apps.googleusercontent.com')
+os.environ.setdefault('GOOGLE_CLIENT_SECRET', 'test')
+
+_client_secret = Path(__file__).resolve().parent.parent / 'credentials' / 'client_secret.json'
+_had_client_secret = _client_secret.exists()
+
+from app.config import Config  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    # Don't leave the test client secret behind for a real run to pick up
+    if not _had_client_secret and _client_secret.exists():
+        _client_secret.unlink()
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path, monkeypatch):
+    """Point every durable path of the app into the test's temp directory"""
+    temp_dir = tmp_path / 'temp'
+    state = temp_dir / 'state'
+    monkeypatch.setattr(Config, 'TEMP_DIR', temp_dir)
+    monkeypatch.setattr(Config, 'JOBS_DIR', temp_dir / 'jobs')
+    monkeypatch.setattr(Config, 'STATE_DIR', state)
+    monkeypatch.setattr(Config, 'UPLOAD_SESSION_DIR', state / 'uploads')
+    monkeypatch.setattr(Config, 'JOB_DB_FILE', state / 'jobs.db')
+    monkeypatch.setattr(Config, 'QUOTA_DIR', state / 'quota')
+    monkeypatch.setattr(Config, 'UPLOAD_LEDGER_FILE', state / 'ledger.db')
+    monkeypatch.setattr(Config, 'DISK_RESERVATION_FILE', state / 'disk.db')
+    for directory in (Config.JOBS_DIR, Config.UPLOAD_SESSION_DIR, Config.QUOTA_DIR):
+        directory.mkdir(parents=True, exist_ok=True)
+    return state
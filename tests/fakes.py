@@ -0,0 +1,45 @@
+import asyncio
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class FakeMediaClient:
+    """Stands in for a pyrogram Client serving one file from memory.
+
+    Like pyrogram's get_file, a stream holds one of the client's
+    max_concurrent_transmissions slots until it is exhausted, and every
+    1 MiB chunk takes `latency` seconds to arrive. `queued` counts the
+    streams that ever had to wait for a slot, `calls` every stream opened,
+    each of which costs pyrogram a media session.
+    """
+
+    def __init__(self, data: bytes, max_concurrent_transmissions: int = 1, latency: float = 0.01,
+                 name: str = 'fake'):
+        self.data = data
+        self.name = name
+        self.latency = latency
+        self.max_concurrent_transmissions = max_concurrent_transmissions
+        self.get_file_semaphore = asyncio.Semaphore(max_concurrent_transmissions)
+        self.active = 0
+        self.peak = 0
+        self.queued = 0
+        self.calls = 0
+
+    async def stream_media(self, message, limit: int = 0, offset: int = 0):
+        self.calls += 1
+        if self.get_file_semaphore.locked():
+            self.queued += 1
+        async with self.get_file_semaphore:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            try:
+                chunk = offset
+                while not limit or chunk < offset + limit:
+                    data = self.data[chunk * CHUNK_SIZE:(chunk + 1) * CHUNK_SIZE]
+                    if not data:
+                        break
+                    await asyncio.sleep(self.latency)
+                    yield data
+                    chunk += 1
+            finally:
+                self.active -= 1
@@ -0,0 +1,55 @@
+import asyncio
+import shutil
+import time
+
+import pytest
+
+from app.config import Config
+from app.disk_budget import DiskBudget
+
+GB = 1024 ** 3
+
+
+def _budgets(tmp_path, count: int) -> list:
+    """Budgets of separate processes sharing one temp volume, with room for one 1 GB download"""
+    margin = shutil.disk_usage(tmp_path).free - int(1.5 * GB)
+    return [DiskBudget(tmp_path, margin) for _ in range(count)]
+
+
+def test_reservations_are_shared_between_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DISK_WAIT_INTERVAL', 0.05)
+    first, second = _budgets(tmp_path, 2)
+
+    async def main():
+        async with first.reserve('a', tmp_path / 'a', GB):
+            assert second.outstanding() == GB
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(second.reserve('b', tmp_path / 'b', GB).__aenter__(), 0.3)
+
+        # Admitted once the other process let go
+        async with second.reserve('b', tmp_path / 'b', GB):
+            assert first.outstanding() == GB
+        assert first.outstanding() == 0
+
+    asyncio.run(main())
+
+
+def test_expired_lease_stops_counting(tmp_path, monkeypatch):
+    budget, = _budgets(tmp_path, 1)
+    budget.conn.execute(
+        'INSERT INTO reservations (job_id, workspace, expected, renewed_at) VALUES (?, ?, ?, ?)',
+        ('crashed', str(tmp_path / 'crashed'), GB, time.time() - Config.DISK_RESERVATION_LEASE - 1)
+    )
+    assert budget.outstanding() == 0
+
+
+def test_lease_is_renewed_while_held(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DISK_RESERVATION_LEASE', 0.3)
+    first, second = _budgets(tmp_path, 2)
+
+    async def main():
+        async with first.reserve('a', tmp_path / 'a', GB):
+            await asyncio.sleep(0.6)
+            assert second.outstanding() == GB
+
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+from app.format_selector import FormatSelector
+
+MB = 1024 * 1024
+
+
+def _video(format_id, height, size, ext='mp4', acodec='none'):
+    return {
+        'format_id': format_id, 'ext': ext, 'height': height, 'width': height * 16 // 9,
+        'vcodec': 'avc1', 'acodec': acodec, 'protocol': 'https', 'filesize': size, 'tbr': height,
+    }
+
+
+def _audio(format_id, size, ext='m4a'):
+    return {
+        'format_id': format_id, 'ext': ext, 'vcodec': 'none', 'acodec': 'mp4a',
+        'protocol': 'https', 'filesize': size, 'tbr': 128,
+    }
+
+
+def _select(selector, formats):
+    return list(selector({'formats': formats}))
+
+
+def test_merged_selection_describes_the_output():
+    selector = FormatSelector(720, 1080, 1024 * MB, merge_output_format='mkv')
+    formats = [_audio('140', 5 * MB), _video('137', 1080, 50 * MB, ext='webm')]
+
+    [chosen] = _select(selector, formats)
+
+    assert chosen['format_id'] == '137+140'
+    assert chosen['height'] == 1080
+    assert chosen['vcodec'] == 'avc1'
+    assert chosen['acodec'] == 'mp4a'
+    assert chosen['ext'] == 'mkv'
+    assert chosen['filesize_approx'] == 55 * MB
+
+
+def test_fallback_never_picks_a_video_only_format():
+    selector = FormatSelector(720, 1080, 10 * MB)
+    # Nothing fits the size limit, and yt-dlp's last format has no audio
+    formats = [
+        _video('18', 360, 20 * MB, acodec='mp4a'),
+        _audio('140', 5 * MB),
+        _video('137', 1080, 50 * MB),
+    ]
+
+    [chosen] = _select(selector, formats)
+
+    assert chosen['format_id'] == '137+140'
+    assert chosen['acodec'] == 'mp4a'
+
+
+def test_fallback_prefers_pre_muxed_at_the_same_quality():
+    selector = FormatSelector(720, 1080, 10 * MB)
+    formats = [
+        _audio('140', 5 * MB),
+        _video('136', 720, 30 * MB),
+        _video('22', 720, 40 * MB, acodec='mp4a'),
+    ]
+    formats[2]['tbr'] = formats[1]['tbr'] + 128
+
+    [chosen] = _select(selector, formats)
+
+    assert chosen['format_id'] == '22'
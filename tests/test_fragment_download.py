@@ -0,0 +1,136 @@
+"""Parallel fragment downloads against a local HLS server"""
+import asyncio
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.config import Config
+from app.video_downloader import VideoDownloader
+
+SEGMENTS = 16
+SEGMENT_SIZE = 64 * 1024
+SEGMENT_DELAY = 0.15
+
+
+class HLSServer(ThreadingHTTPServer):
+    """Serves a VOD playlist under any directory; segments each take SEGMENT_DELAY to arrive.
+
+    Concurrent segment requests are counted in total and per directory.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), HLSHandler)
+        self.segment = os.urandom(SEGMENT_SIZE)
+        self.lock = threading.Lock()
+        self.active = {}
+        self.peak = {}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class HLSHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.endswith('.m3u8'):
+            lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:2', '#EXT-X-MEDIA-SEQUENCE:0']
+            for index in range(SEGMENTS):
+                lines += ['#EXTINF:2.0,', f'segment{index}.ts']
+            lines.append('#EXT-X-ENDLIST')
+            self._send('\n'.join(lines).encode(), 'application/vnd.apple.mpegurl')
+            return
+
+        server = self.server
+        keys = (None, self.path.rsplit('/', 1)[0])
+        with server.lock:
+            for key in keys:
+                server.active[key] = server.active.get(key, 0) + 1
+                server.peak[key] = max(server.peak.get(key, 0), server.active[key])
+        try:
+            time.sleep(SEGMENT_DELAY)
+            self._send(server.segment, 'video/mp2t')
+        finally:
+            with server.lock:
+                for key in keys:
+                    server.active[key] -= 1
+
+    def _send(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def hls_server():
+    server = HLSServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+async def _download(downloader, urls, output_dirs):
+    # Extract first, the download then reuses the cached info and only moves fragments
+    for url in urls:
+        info = await downloader.get_video_info(url)
+        assert info['success'], info
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        downloader.download_video(url, path) for url, path in zip(urls, output_dirs)
+    ))
+    return results, time.perf_counter() - started
+
+
+def _downloader(monkeypatch, fragments: int, per_host: int) -> VideoDownloader:
+    monkeypatch.setattr(Config, 'YTDL_CONCURRENT_FRAGMENTS', fragments)
+    monkeypatch.setattr(Config, 'YTDL_MAX_CONNECTIONS_PER_HOST', per_host)
+    return VideoDownloader(process_workers=0)
+
+
+def test_parallel_fragments_scale_throughput(hls_server, tmp_path, monkeypatch):
+    timings = {}
+    for fragments in (1, 4):
+        downloader = _downloader(monkeypatch, fragments, 8)
+        try:
+            results, elapsed = asyncio.run(_download(
+                downloader, [f"{hls_server.url}/f{fragments}/video.m3u8"], [tmp_path / f"f{fragments}"]
+            ))
+        finally:
+            downloader.close()
+        assert results[0]['success'], results[0]
+        assert os.path.getsize(results[0]['file_path']) == SEGMENTS * SEGMENT_SIZE
+        timings[fragments] = elapsed
+
+    print(f"\n{SEGMENTS} segments of {SEGMENT_DELAY}s: 1 connection {timings[1]:.2f}s, "
+          f"4 connections {timings[4]:.2f}s ({timings[1] / timings[4]:.1f}x)")
+    assert timings[4] * 1.8 < timings[1]
+    assert hls_server.peak == {None: 4, '/f1': 1, '/f4': 4}
+
+
+def test_host_cap_grants_hold_per_job(hls_server, tmp_path, monkeypatch):
+    # Two jobs would like 4 connections each, the host allows 6 in total
+    downloader = _downloader(monkeypatch, 4, 6)
+    try:
+        results, _ = asyncio.run(_download(
+            downloader,
+            [f"{hls_server.url}/a/video.m3u8", f"{hls_server.url}/b/video.m3u8"],
+            [tmp_path / 'a', tmp_path / 'b']
+        ))
+    finally:
+        downloader.close()
+
+    assert all(result['success'] for result in results), results
+    # Each job keeps to its own grant: the first gets 4, the other what is left
+    assert hls_server.peak[None] == 6
+    assert sorted([hls_server.peak['/a'], hls_server.peak['/b']]) == [2, 4]
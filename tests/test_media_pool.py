@@ -0,0 +1,75 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from app.media_pool import MediaClientPool
+from app.telegram_download import TelegramDownload
+
+from fakes import FakeMediaClient
+
+
+def _pool(*clients) -> MediaClientPool:
+    pool = MediaClientPool('test', 0, clients[0])
+    # As if start() had logged the sessions in
+    pool._load = {client: 0 for client in clients}
+    return pool
+
+
+def test_slots_are_balanced_by_capacity():
+    big, small = FakeMediaClient(b'', 4, name='big'), FakeMediaClient(b'', 2, name='small')
+    pool = _pool(big, small)
+
+    async def main():
+        async with pool.acquire(4) as download:
+            assert sorted(client.name for client in download) == ['big', 'big', 'big', 'small']
+            async with pool.acquire() as (stream,):
+                assert stream is small
+                # Only one slot is left, the next download gets just that one
+                async with pool.acquire(4) as partial:
+                    assert partial == [big]
+                    with pytest.raises(asyncio.TimeoutError):
+                        await asyncio.wait_for(pool.acquire().__aenter__(), 0.05)
+            assert pool._load == {big: 3, small: 1}
+        assert pool._load == {big: 0, small: 0}
+
+    asyncio.run(main())
+
+
+def test_waiting_caller_gets_released_slot():
+    client = FakeMediaClient(b'', 1)
+    pool = _pool(client)
+
+    async def main():
+        order = []
+
+        async def transfer(name, hold):
+            async with pool.acquire() as (assigned,):
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        await asyncio.gather(transfer('first', 0.05), transfer('second', 0))
+        return order
+
+    assert asyncio.run(main()) == ['first', 'second']
+
+
+def test_concurrent_downloads_never_queue_in_pyrogram(tmp_path):
+    data = os.urandom(8 * 1024 * 1024 + 100)
+    clients = [FakeMediaClient(data, 2, 0.01, name=f"media{index}") for index in range(2)]
+    pool = _pool(*clients)
+
+    async def download(index):
+        async with pool.acquire(4) as assigned:
+            job = TelegramDownload(assigned, None, tmp_path / f"{index}.mp4", len(data),
+                                   connections=len(assigned))
+            return await job.run()
+
+    async def main():
+        return await asyncio.gather(*(download(index) for index in range(3)))
+
+    digests = asyncio.run(main())
+    assert set(digests) == {hashlib.sha256(data).hexdigest()}
+    assert all(client.queued == 0 for client in clients)
+    assert all(client.peak == 2 for client in clients)
@@ -0,0 +1,27 @@
+import asyncio
+
+from app.progress import ProgressReporter
+
+
+def test_progress_after_the_stage_is_ignored():
+    edits = []
+
+    async def edit(job, text):
+        edits.append(text)
+
+    async def main():
+        reporter = ProgressReporter(edit, interval=0, edits_per_minute=60)
+        job = {'id': 'job', 'chat_id': 1}
+        async with reporter.track(job, 'Downloading') as tracker:
+            tracker(1, 2)
+            await asyncio.sleep(0.05)
+        edits.append('next stage')
+
+        # As a reader thread would, after the stage ended
+        asyncio.get_running_loop().call_soon_threadsafe(tracker, 2, 2)
+        await asyncio.sleep(0.05)
+        return tracker
+
+    tracker = asyncio.run(main())
+    assert len(edits) == 2 and edits[-1] == 'next stage'
+    assert tracker._latest == (1, 2)
@@ -0,0 +1,105 @@
+import multiprocessing
+import time
+
+from app.config import Config
+from app.credential_pool import CredentialPool, PooledCredential
+from app.quota import API_COSTS, QuotaLedger
+
+UPLOAD_COST = API_COSTS['videos.insert']
+
+
+def _pool(*names) -> CredentialPool:
+    pool = CredentialPool([])
+    pool.members = [PooledCredential(name, 'oauth', None) for name in names]
+    return pool
+
+
+def test_running_uploads_are_counted_once():
+    pool = _pool('a')
+    member = pool.members[0]
+
+    running = []
+    for _ in range(3):
+        reservation = pool.acquire(UPLOAD_COST)
+        pool.commit(reservation, 'videos.insert')
+        running.append(reservation)
+
+    assert member.quota.used() == 3 * UPLOAD_COST
+    assert member.quota.remaining() == Config.YOUTUBE_DAILY_QUOTA - 3 * UPLOAD_COST
+    assert pool.acquire(UPLOAD_COST) is not None
+
+
+def test_release_returns_only_uncharged_units():
+    pool = _pool('a')
+    quota = pool.members[0].quota
+
+    charged = pool.acquire(UPLOAD_COST)
+    unused = pool.acquire(UPLOAD_COST)
+    pool.commit(charged, 'videos.insert')
+    pool.release(charged)
+    pool.release(unused)
+    pool.release(unused)
+
+    assert quota.reserved() == 0
+    assert quota.used() == UPLOAD_COST
+    assert pool.members[0].in_flight == 0
+
+
+def test_recreated_session_is_charged_again():
+    pool = _pool('a')
+    quota = pool.members[0].quota
+
+    reservation = pool.acquire(UPLOAD_COST)
+    pool.commit(reservation, 'videos.insert')
+    pool.commit(reservation, 'videos.insert')
+    pool.release(reservation)
+
+    assert quota.used() == 2 * UPLOAD_COST
+    assert quota.reserved() == 0
+
+
+def _record_many(path, count):
+    ledger = QuotaLedger(path)
+    for _ in range(count):
+        ledger.record('channels.list')
+
+
+def test_usage_is_shared_between_processes(tmp_path):
+    path = tmp_path / 'shared.json'
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_record_many, args=(path, 50)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert all(worker.exitcode == 0 for worker in workers)
+    assert QuotaLedger(path).used() == 200
+
+
+def test_reservations_are_shared_between_processes(tmp_path):
+    path = tmp_path / 'shared.json'
+    first, second = QuotaLedger(path), QuotaLedger(path)
+
+    keys = [first.reserve(UPLOAD_COST) for _ in range(Config.YOUTUBE_DAILY_QUOTA // UPLOAD_COST)]
+    assert all(keys)
+    # The other worker sees the units as taken and is not admitted
+    assert second.reserve(UPLOAD_COST) is None
+
+    first.release(keys[0])
+    assert second.reserve(UPLOAD_COST)
+
+
+def test_reservation_lapses_unless_renewed(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'QUOTA_RESERVATION_LEASE', 0.2)
+    path = tmp_path / 'shared.json'
+    holder, other = QuotaLedger(path), QuotaLedger(path)
+
+    renewed = holder.reserve(UPLOAD_COST)
+    holder.reserve(UPLOAD_COST)
+    for _ in range(3):
+        time.sleep(0.1)
+        holder.renew(renewed)
+
+    # Only the reservation of the holder that kept renewing is left
+    assert other.reserved() == UPLOAD_COST
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from app.resumable_upload import ResumableUpload, StreamMedia, UploadNotResumableError
+from app.streaming import StreamBuffer
+
+CHUNK_SIZE = 256 * 1024
+
+
+class ExpiringTransport:
+    """Opens a session, acknowledges the first chunk, then reports the session gone"""
+
+    def __init__(self):
+        self.puts = 0
+
+    async def request(self, uri, method, body=None, headers=None):
+        if method == 'POST':
+            return 200, {'location': 'http://upload/session'}, b''
+        self.puts += 1
+        if self.puts == 1:
+            return 308, {'range': f'bytes=0-{len(body) - 1}'}, b''
+        return 404, {}, b'Not Found'
+
+
+async def _chunks(count):
+    for _ in range(count):
+        yield b'x' * CHUNK_SIZE
+
+
+def test_lost_session_of_stream_fails_clearly():
+    async def main():
+        buffer = StreamBuffer(4)
+        producer = asyncio.create_task(buffer.feed(_chunks(3)))
+        upload = ResumableUpload(ExpiringTransport(), StreamMedia(buffer, 3 * CHUNK_SIZE),
+                                 {'snippet': {}}, chunk_size=CHUNK_SIZE)
+        try:
+            await upload.execute()
+        finally:
+            producer.cancel()
+
+    with pytest.raises(UploadNotResumableError, match='cannot be rewound') as error:
+        asyncio.run(main())
+    assert error.value.status == 404
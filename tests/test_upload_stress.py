@@ -0,0 +1,134 @@
+"""Many simultaneous resumable uploads against a local fake of the upload endpoint"""
+import asyncio
+import hashlib
+import os
+import re
+
+import aiohttp
+import pytest
+from aiohttp import web
+from google.oauth2.credentials import Credentials
+
+from app import resumable_upload
+from app.resumable_upload import (
+    ResumableUpload, FileMedia, AuthorizedHttpPool, Httplib2Transport, AiohttpTransport
+)
+
+UPLOADS = 16
+FILE_SIZE = 3 * 256 * 1024 + 1000
+CHUNK_SIZE = 256 * 1024
+
+
+class FakeUploadServer:
+    """Speaks enough of the resumable protocol; fails every session's second chunk once"""
+
+    def __init__(self):
+        self.sessions = {}
+        self.connections = set()
+        self.active = 0
+        self.peak = 0
+        self.requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=2 * CHUNK_SIZE)
+        app.router.add_post('/upload', self.start)
+        app.router.add_put('/session/{id}', self.put)
+        return app
+
+    async def _track(self, request):
+        self.connections.add(request.transport.get_extra_info('peername'))
+        self.requests += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        # Let requests of other uploads overlap with this one
+        await asyncio.sleep(0.01)
+
+    async def start(self, request):
+        await self._track(request)
+        try:
+            assert request.headers['Authorization'] == 'Bearer token'
+            session_id = str(len(self.sessions))
+            self.sessions[session_id] = {
+                'data': bytearray(),
+                'size': int(request.headers['X-Upload-Content-Length']),
+                'failed': False,
+            }
+            location = f"{request.scheme}://{request.host}/session/{session_id}"
+            return web.Response(status=200, headers={'Location': location})
+        finally:
+            self.active -= 1
+
+    async def put(self, request):
+        await self._track(request)
+        try:
+            session = self.sessions[request.match_info['id']]
+            body = await request.read()
+            match = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', request.headers['Content-Range'])
+            if match:
+                start = int(match.group(1))
+                if start == CHUNK_SIZE and not session['failed']:
+                    session['failed'] = True
+                    return web.Response(status=503)
+                assert start == len(session['data'])
+                session['data'].extend(body)
+
+            if len(session['data']) == session['size']:
+                digest = hashlib.sha256(session['data']).hexdigest()
+                return web.json_response({'id': request.match_info['id'], 'sha256': digest})
+            headers = {'Range': f"bytes=0-{len(session['data']) - 1}"} if session['data'] else {}
+            return web.Response(status=308, headers=headers)
+        finally:
+            self.active -= 1
+
+
+async def _run_uploads(tmp_path, make_transport, monkeypatch):
+    server = FakeUploadServer()
+    runner = web.AppRunner(server.app())
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    monkeypatch.setattr(resumable_upload, 'UPLOAD_URL', f"http://127.0.0.1:{port}/upload")
+    # Keep the retry after the injected 503 short
+    monkeypatch.setattr(resumable_upload, 'MAX_BACKOFF', 0)
+
+    files = []
+    for index in range(UPLOADS):
+        path = tmp_path / f"video{index}.mp4"
+        path.write_bytes(os.urandom(FILE_SIZE))
+        files.append(path)
+
+    credentials = Credentials(token='token')
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=8))
+    try:
+        transport = make_transport(session, credentials)
+        uploads = [
+            ResumableUpload(transport, FileMedia(path), {'snippet': {'title': path.name}},
+                            chunk_size=CHUNK_SIZE, max_retries=3)
+            for path in files
+        ]
+        responses = await asyncio.wait_for(
+            asyncio.gather(*(upload.execute() for upload in uploads)), timeout=60
+        )
+    finally:
+        await session.close()
+        await runner.cleanup()
+
+    for path, response in zip(files, responses):
+        assert response['sha256'] == hashlib.sha256(path.read_bytes()).hexdigest()
+    return server
+
+
+@pytest.mark.parametrize('make_transport', [
+    pytest.param(lambda session, credentials: AiohttpTransport(session, credentials), id='aiohttp'),
+    pytest.param(lambda session, credentials: Httplib2Transport(AuthorizedHttpPool(credentials, 8)), id='httplib2'),
+])
+def test_simultaneous_uploads_complete(tmp_path, monkeypatch, make_transport):
+    server = asyncio.run(_run_uploads(tmp_path, make_transport, monkeypatch))
+
+    assert len(server.sessions) == UPLOADS
+    # Uploads really ran side by side, over reused keep-alive connections
+    assert server.peak > 1
+    assert len(server.connections) < server.requests / 2
+    print(f"\n{server.requests} requests, peak {server.peak} in flight, "
+          f"{len(server.connections)} connections")
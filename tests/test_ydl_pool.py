@@ -0,0 +1,58 @@
+import asyncio
+
+from app.format_selector import FormatSelector
+from app.ydl_pool import YoutubeDLPool
+
+
+def _base_params() -> dict:
+    return {
+        'format': FormatSelector(720, 1080, 1024 ** 3),
+        'outtmpl': '%(title)s.%(ext)s',
+        'quiet': True,
+        'concurrent_fragment_downloads': 4,
+    }
+
+
+def test_concurrent_checkouts_keep_their_own_params(tmp_path):
+    base = _base_params()
+    pool = YoutubeDLPool(base, 2)
+
+    async def job(name, started, both_started):
+        paths = {'home': str(tmp_path / name), 'temp': str(tmp_path / name)}
+        async with pool.checkout(paths=paths, outtmpl={'default': f'{name}.%(ext)s'},
+                                 concurrent_fragment_downloads=len(name)) as pooled:
+            started.set()
+            await both_started.wait()
+            # The other job has applied its params by now
+            await asyncio.sleep(0)
+            return pooled, dict(pooled.ydl.params)
+
+    async def main():
+        first, second = asyncio.Event(), asyncio.Event()
+        both = asyncio.Event()
+
+        async def release_when_both():
+            await first.wait()
+            await second.wait()
+            both.set()
+
+        results = await asyncio.gather(
+            job('a', first, both), job('bb', second, both), release_when_both()
+        )
+        return results[:2]
+
+    (pooled_a, params_a), (pooled_b, params_b) = asyncio.run(main())
+
+    assert pooled_a is not pooled_b
+    assert params_a['paths']['home'] == str(tmp_path / 'a')
+    assert params_b['paths']['home'] == str(tmp_path / 'bb')
+    assert params_a['outtmpl'] == {'default': 'a.%(ext)s'}
+    assert params_b['concurrent_fragment_downloads'] == 2
+
+    # Nothing leaked into the shared options, and released instances are restored
+    assert base == _base_params() | {'format': base['format']}
+    for pooled in (pooled_a, pooled_b):
+        assert 'paths' not in pooled.ydl.params
+        assert pooled.ydl.params['concurrent_fragment_downloads'] == 4
+        assert pooled.ydl.params['format'] is base['format']
+    pool.close()
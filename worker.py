@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Telegram YouTube Bot - Upload Worker Entry Point
+
+Runs download/upload workers for a bot started with RUN_MODE=frontend.
+"""
+import os
+import sys
+import socket
+import logging
+import argparse
+import multiprocessing
+from pathlib import Path
+
+# Add app directory to Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+def run_worker(worker_id: str):
+    """Run a single worker process"""
+    from app.worker import UploadWorker
+
+    try:
+        UploadWorker(worker_id).run()
+    except KeyboardInterrupt:
+        logging.info("Worker stopped by user")
+
+def main():
+    """Worker entry point"""
+    parser = argparse.ArgumentParser(description="Run upload workers")
+    parser.add_argument('--id', default=os.getenv('WORKER_ID', socket.gethostname()),
+                        help="Stable worker ID; claims of a restarted worker are released")
+    parser.add_argument('--processes', type=int, default=int(os.getenv('WORKER_PROCESSES', 1)),
+                        help="Number of worker processes to start")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_worker(args.id)
+        return
+
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(f"{args.id}-{index}",))
+        for index in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        logging.info("Workers stopped by user")
+
+if __name__ == "__main__":
+    main()